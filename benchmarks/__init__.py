@@ -0,0 +1,23 @@
+"""benchmarks -- offline benchmarks for the conference API hot paths
+
+Run from the repository root with the App Engine SDK available, e.g.
+
+    APPENGINE_SDK=/path/to/google_appengine python -m benchmarks.bench_serializers
+
+"""
+
+import os
+import sys
+
+
+def setupSdk():
+    """Put the App Engine SDK and the app itself on sys.path."""
+    sdk = os.environ.get('APPENGINE_SDK')
+    if sdk and sdk not in sys.path:
+        sys.path.insert(0, sdk)
+        import dev_appserver
+        dev_appserver.fix_sys_path()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if root not in sys.path:
+        sys.path.insert(0, root)
+    os.environ.setdefault('APPLICATION_ID', 'dev~conference-bench')
@@ -0,0 +1,339 @@
+"""bench_endpoints.py -- per-method latency, RPCs and memory of ConferenceApi
+
+Generates a synthetic dataset (benchmarks/dataset.py) on the testbed
+datastore, memcache and taskqueue stubs.  Every ConferenceApi method is
+then called ITERATIONS times as its own request.  The report gives p50 /
+p99 / mean latency, RPCs and memcache hits per call (counted by
+metrics.py) and RSS growth.  The attendee and session exports are timed
+on a conference of spec.exportRows rows.
+
+Each scale runs in a fresh process so peak memory is per scale:
+
+    APPENGINE_SDK=... python -m benchmarks.bench_endpoints \\
+        --scales 1,5,25 --output bench-$(git rev-parse --short HEAD).json
+
+Compare the JSON files of two commits to spot hot path regressions.
+
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks import setupSdk
+setupSdk()
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+from protorpc import message_types
+
+import export
+import metrics
+import search
+from benchmarks.dataset import DatasetSpec
+from benchmarks.dataset import generate
+from conference import CONF_FIELDS_PAGE_REQUEST
+from conference import CONF_GET_REQUEST
+from conference import CONF_PAGE_REQUEST
+from conference import CONF_SEARCH_REQUEST
+from conference import ConferenceApi
+from conference import FIELDS_PAGE_REQUEST
+from conference import PAGE_REQUEST
+from conference import SESSION_GET_REQUEST
+from conference import SESSION_SEARCH_REQUEST
+from conference import SPEAKER_PAGE_REQUEST
+from models import BulkSessionForms
+from models import ConferenceForm
+from models import ConferenceForms
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import ProfileMiniForm
+from models import SessionByDateForm
+from models import SessionFilterForm
+from models import SessionForm
+from models import SessionQueryForm
+from models import SessionSearchForm
+from models import TeeShirtSize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ITERATIONS = 50
+BULK_ITEMS = 50
+# the list view field masks served by projection queries
+CONFERENCE_LIST_FIELDS = 'name,city,startDate,maxAttendees,seatsAvailable,websafeKey'
+SESSION_LIST_FIELDS = 'name,date,startTime,typeOfSession,speaker,websafeKey'
+
+
+def _conferenceForm(rnd, i):
+    return ConferenceForm(name='Benchmark conference %d' % i, city='London',
+                          topics=['Web Technologies'], startDate='2016-07-01',
+                          endDate='2016-07-03', maxAttendees=100)
+
+
+def _sessionForm(rnd, i, wsck=None):
+    return SessionForm(name='Benchmark session %d' % i, speaker='Speaker %d' % rnd.randint(0, 9),
+                       duration=60, typeOfSession='lecture', date='2016-07-01',
+                       startTime='10:00', websafeConferenceKey=wsck)
+
+
+def _register(data, rnd):
+    # a conference the attendee hasn't registered for yet
+    email = rnd.choice(data.profiles)
+    conf_key = rnd.choice([key for key in data.conferenceKeys
+                           if key not in data.registrations[email]])
+    data.registrations[email].add(conf_key)
+    return email, CONF_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=conf_key.urlsafe())
+
+
+def _unregister(data, rnd):
+    email = rnd.choice([e for e in data.profiles if data.registrations[e]])
+    conf_key = rnd.choice(sorted(data.registrations[email]))
+    data.registrations[email].discard(conf_key)
+    return email, CONF_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=conf_key.urlsafe())
+
+
+def _wishlist(data, rnd):
+    # a conference the attendee registered for
+    email = rnd.choice([e for e in data.profiles if data.registrations[e]])
+    conf_key = rnd.choice(sorted(data.registrations[email]))
+    return email, CONF_GET_REQUEST.combined_message_class(
+        websafeConferenceKey=conf_key.urlsafe())
+
+
+def scenarios(data, rnd):
+    """Return [(label, callable returning (user email, request))]; the
+    label is the method name, optionally followed by a [variant].
+    """
+    org = data.organizer
+    attendee = lambda: rnd.choice(data.profiles)
+    wsck = lambda: rnd.choice(data.conferenceKeys).urlsafe()
+    wssk = lambda: rnd.choice(data.sessionKeys[rnd.choice(data.conferenceKeys)]).urlsafe()
+    void = message_types.VoidMessage
+    return [
+        ('getProfile', lambda: (attendee(), void())),
+        ('saveProfile', lambda: (attendee(), ProfileMiniForm(
+            displayName='Renamed', teeShirtSize=TeeShirtSize.M_M))),
+        ('createConference', lambda: (org, _conferenceForm(rnd, rnd.randint(0, 1 << 30)))),
+        ('bulkCreateConferences', lambda: (org, ConferenceForms(
+            items=[_conferenceForm(rnd, i) for i in range(BULK_ITEMS)]))),
+        ('queryConferences', lambda: (attendee(), ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field='CITY', operator='EQ', value=rnd.choice(['London', 'Paris'])),
+            ConferenceQueryForm(field='MONTH', operator='GT', value=str(rnd.randint(1, 11)))]))),
+        ('getConferencesCreated', lambda: (org, FIELDS_PAGE_REQUEST.combined_message_class())),
+        ('getConferencesCreated[fields]', lambda: (org, FIELDS_PAGE_REQUEST.combined_message_class(
+            fields=CONFERENCE_LIST_FIELDS))),
+        ('queryConferences[fields]', lambda: (attendee(), ConferenceQueryForms(
+            fields=CONFERENCE_LIST_FIELDS, pageSize=rnd.choice([10, 20, 30])))),
+        ('getConferencesToAttend', lambda: (attendee(), void())),
+        ('getConference', lambda: (attendee(), CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck()))),
+        ('getAnnouncement', lambda: (attendee(), void())),
+        ('registerForConference', lambda: _register(data, rnd)),
+        ('unregisterFromConference', lambda: _unregister(data, rnd)),
+        ('getConferenceAttendees', lambda: (org, CONF_PAGE_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck()))),
+        ('querySpeakers', lambda: (attendee(), PAGE_REQUEST.combined_message_class())),
+        ('createSession', lambda: (org, _sessionForm(rnd, rnd.randint(0, 1 << 30), wsck()))),
+        ('bulkCreateSessions', lambda: (org, BulkSessionForms(
+            websafeConferenceKey=wsck(),
+            items=[_sessionForm(rnd, i) for i in range(BULK_ITEMS)]))),
+        ('getConferenceSessions', lambda: (attendee(), CONF_FIELDS_PAGE_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck()))),
+        ('getConferenceSessions[fields]', lambda: (attendee(),
+            CONF_FIELDS_PAGE_REQUEST.combined_message_class(
+                websafeConferenceKey=wsck(), fields=SESSION_LIST_FIELDS))),
+        ('getConferenceSessionsByType', lambda: (attendee(), SessionQueryForm(
+            websafeConferenceKey=wsck(), typeOfSession='workshop'))),
+        ('getSessionsBySpeaker', lambda: (attendee(), SPEAKER_PAGE_REQUEST.combined_message_class(
+            websafeSpeakerKey=rnd.choice(data.speakerKeys).urlsafe()))),
+        ('getSessionsByDate', lambda: (attendee(), SessionByDateForm(
+            websafeConferenceKey=wsck(), startDate='2016-01-01', endDate='2016-12-31'))),
+        ('getSpeakersInConference', lambda: (attendee(), CONF_GET_REQUEST.combined_message_class(
+            websafeConferenceKey=wsck()))),
+        ('querySessions', lambda: (attendee(), SessionSearchForm(
+            websafeConferenceKey=wsck(), filters=[
+                SessionFilterForm(field='START_TIME', operator='LT', value='19:00'),
+                SessionFilterForm(field='TYPE', operator='NE', value='workshop')]))),
+        ('getSessionsByMultipleInequalities', lambda: (attendee(), void())),
+        ('addSessionToWishlist', lambda: (attendee(), SESSION_GET_REQUEST.combined_message_class(
+            websafeSessionKey=wssk()))),
+        ('deleteSessionInWishlist', lambda: (attendee(), SESSION_GET_REQUEST.combined_message_class(
+            websafeSessionKey=wssk()))),
+        ('getSessionsInWishlist', lambda: _wishlist(data, rnd)),
+        ('getFeaturedSpeaker', lambda: (attendee(), void())),
+        ('searchConferences', lambda: (attendee(), CONF_SEARCH_REQUEST.combined_message_class(
+            query=rnd.choice(['web', 'synthetic conference', 'medical innovations'])))),
+        ('searchSessions', lambda: (attendee(), SESSION_SEARCH_REQUEST.combined_message_class(
+            query='highlight %d' % rnd.randint(0, 9), websafeConferenceKey=wsck()))),
+    ]
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def _maxrss():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def startRequest(email):
+    """Reset per-request state and sign in as email."""
+    ndb.get_context().clear_cache()
+    os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+    os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'example.com'
+
+
+def benchMethod(api, label, makeRequest, iterations):
+    name = label.split('[')[0]
+    metrics.takeCounts()
+    rss = _maxrss()
+    times = []
+    errors = 0
+    first_error = None
+    for _ in range(iterations):
+        email, request = makeRequest()
+        startRequest(email)
+        start = time.time()
+        try:
+            getattr(api, name)(request)
+        except Exception as e:
+            errors += 1
+            first_error = first_error or repr(e)
+            continue
+        times.append((time.time() - start) * 1000)
+
+    counts = metrics.takeCounts()
+    prefix = '%s ' % name
+    per_call = lambda key: round(float(counts.get(prefix + key, 0)) / iterations, 2)
+    rpcs = dict((key[len(prefix) + 4:], per_call(key[len(prefix):]))
+                for key in counts if key.startswith(prefix + 'rpc '))
+    # a method that fails some of its calls has no meaningful latency
+    latency = lambda value: None if errors else round(value, 2)
+    return {
+        'p50 ms': latency(_percentile(times, 0.5) if times else 0),
+        'p99 ms': latency(_percentile(times, 0.99) if times else 0),
+        'mean ms': latency(sum(times) / len(times) if times else 0),
+        'rpcs per call': rpcs,
+        'memcache hits per call': per_call('memcache hits'),
+        'memcache misses per call': per_call('memcache misses'),
+        'payload bytes per call': per_call('payload bytes'),
+        'errors': errors,
+        'first error': first_error,
+        'maxrss growth kb': _maxrss() - rss,
+    }
+
+
+def benchExports(data):
+    results = {}
+    for what in ('attendees', 'sessions'):
+        for fmt in ('csv', 'ndjson'):
+            ndb.get_context().clear_cache()
+            rss = _maxrss()
+            start = time.time()
+            content_type, chunks = export.exportChunks(what, data.exportConferenceKey, fmt)
+            size = sum(len(chunk) for chunk in chunks)
+            results['%s.%s' % (what, fmt)] = {
+                'seconds': round(time.time() - start, 3),
+                'bytes': size,
+                'maxrss growth kb': _maxrss() - rss,
+            }
+    return results
+
+
+def runScale(scale, iterations, seed):
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.setup_env(app_id='dev~conference-bench', overwrite=True)
+    tb.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1))
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=ROOT)
+    tb.init_app_identity_stub()
+    tb.init_mail_stub()
+    tb.init_user_stub()
+    # the testbed replaced the API proxy the hooks were registered on
+    metrics.installHooks()
+    # measure the payload of every call, not a sample
+    metrics.PAYLOAD_SAMPLE_RATE = 1.0
+    search.setBackend(search.InvertedIndexBackend())
+    try:
+        spec = DatasetSpec.scaled(scale, seed=seed)
+        start = time.time()
+        data = generate(spec)
+        search.reindexAll()
+        generated = time.time() - start
+
+        rnd = random.Random(seed)
+        api = ConferenceApi()
+        methods = {}
+        for label, makeRequest in scenarios(data, rnd):
+            methods[label] = result = benchMethod(api, label, makeRequest, iterations)
+            if result['errors']:
+                sys.stderr.write('scale %d: %-34s %d errors, first: %s\n' % (
+                    scale, label, result['errors'], result['first error']))
+            else:
+                sys.stderr.write('scale %d: %-34s p50 %8.2f ms  p99 %8.2f ms\n' % (
+                    scale, label, result['p50 ms'], result['p99 ms']))
+        return {
+            'scale': scale,
+            'spec': spec.toDict(),
+            'iterations': iterations,
+            'generate seconds': round(generated, 2),
+            'methods': methods,
+            'exports': benchExports(data),
+            'peak rss kb': _maxrss(),
+        }
+    finally:
+        tb.deactivate()
+
+
+def _commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scales', default='1,5,25')
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='-')
+    parser.add_argument('--scale', type=int, help='run one scale in this process')
+    args = parser.parse_args()
+
+    if args.scale is not None:
+        json.dump(runScale(args.scale, args.iterations, args.seed), sys.stdout)
+        return
+
+    runs = []
+    for scale in [int(s) for s in args.scales.split(',')]:
+        out = subprocess.check_output([
+            sys.executable, '-m', 'benchmarks.bench_endpoints', '--scale', str(scale),
+            '--iterations', str(args.iterations), '--seed', str(args.seed)], cwd=ROOT)
+        runs.append(json.loads(out))
+    report = json.dumps({'commit': _commit(), 'runs': runs}, indent=2, sort_keys=True)
+    if args.output == '-':
+        print report
+    else:
+        with open(args.output, 'w') as f:
+            f.write(report + '\n')
+
+    # the report is still written, to show what failed
+    failed = sorted(set(label for run in runs
+                        for label, result in run['methods'].iteritems() if result['errors']))
+    if failed:
+        sys.exit('methods with errors: %s' % ', '.join(failed))
+
+
+if __name__ == '__main__':
+    main()
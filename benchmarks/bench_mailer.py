@@ -0,0 +1,60 @@
+"""bench_mailer.py -- email worker throughput against a stub sender
+
+Queues emails on the testbed's mail pull queue and drains it with
+MailWorker at several concurrency limits.  StubSender simulates the Mail
+API's latency (and optionally a failure rate) instead of sending.
+
+"""
+
+import os
+import time
+
+from benchmarks import setupSdk
+setupSdk()
+
+from google.appengine.ext import testbed
+
+import mailer
+
+NUM_EMAILS = 500
+SEND_LATENCY = 0.02
+CONCURRENCY = [1, 5, 10, 20]
+
+
+def makeTestbed():
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_app_identity_stub()
+    tb.init_memcache_stub()
+    # queue.yaml lives in the repository root
+    tb.init_taskqueue_stub(root_path=os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    return tb
+
+
+def queueEmails(n):
+    mailer.queueEmails([('conference_created', 'user%d@example.com' % i, {
+        'name': 'Conference %d' % i, 'description': '', 'city': 'London',
+        'topics': 'Web', 'startDate': '2016-05-01', 'endDate': '2016-05-03',
+        'maxAttendees': 100}, 'bench-%d-%f' % (i, time.time())) for i in range(n)])
+
+
+def main():
+    print '%d emails, %.0f ms simulated send latency' % (NUM_EMAILS, SEND_LATENCY * 1000)
+    for concurrency in CONCURRENCY:
+        tb = makeTestbed()
+        try:
+            queueEmails(NUM_EMAILS)
+            sender = mailer.StubSender(latency=SEND_LATENCY)
+            worker = mailer.MailWorker(sender=sender, concurrency=concurrency)
+            start = time.time()
+            batches = worker.run(seconds=600)
+            elapsed = time.time() - start
+            print 'concurrency %3d: %4d sent in %3d batches, %7.1f emails/s' % (
+                concurrency, len(sender.sent), len(batches), len(sender.sent) / elapsed)
+        finally:
+            tb.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""bench_oauth.py -- getUserId(user, "oauth") latency with and without caches
+
+Runs a local stand-in for Google's tokeninfo and certs endpoints (with a
+simulated network latency) and points settings at it.  Compares uncached
+tokeninfo lookups, cached lookups and local id_token verification.
+
+"""
+
+import BaseHTTPServer
+import base64
+import json
+import os
+import threading
+import time
+import urlparse
+
+from benchmarks import setupSdk
+setupSdk()
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from google.appengine.ext import testbed
+
+import settings
+import utils
+
+NUM_TOKENS = 200
+SERVER_LATENCY = 0.05
+KEY_ID = 'bench-key'
+SIGNING_KEY = RSA.generate(2048)
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def b64long(n):
+    hexed = '%x' % n
+    return b64(('0' * (len(hexed) % 2) + hexed).decode('hex'))
+
+
+def makeIdToken(user_id):
+    header = b64(json.dumps({'alg': 'RS256', 'kid': KEY_ID}))
+    payload = b64(json.dumps({
+        'sub': user_id, 'iss': 'accounts.google.com',
+        'aud': settings.WEB_CLIENT_ID, 'exp': int(time.time()) + 3600}))
+    signature = PKCS1_v1_5.new(SIGNING_KEY).sign(SHA256.new('%s.%s' % (header, payload)))
+    return '%s.%s.%s' % (header, payload, b64(signature))
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Answers /tokeninfo (accepting any token) and /certs."""
+
+    def do_GET(self):
+        time.sleep(SERVER_LATENCY)
+        url = urlparse.urlparse(self.path)
+        if url.path == '/certs':
+            body = {'keys': [{'kid': KEY_ID, 'kty': 'RSA', 'alg': 'RS256',
+                              'n': b64long(SIGNING_KEY.n), 'e': b64long(SIGNING_KEY.e)}]}
+        else:
+            body = {'user_id': 'stand-in-user', 'expires_in': 3600}
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Cache-Control', 'public, max-age=3600')
+        self.end_headers()
+        self.wfile.write(json.dumps(body))
+
+    def log_message(self, *args):
+        pass
+
+
+def startServer():
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    base = 'http://127.0.0.1:%d' % server.server_port
+    settings.TOKENINFO_URL = base + '/tokeninfo'
+    settings.CERTS_URL = base + '/certs'
+
+
+def timeTokens(label, tokens):
+    start = time.time()
+    for token in tokens:
+        os.environ['HTTP_AUTHORIZATION'] = 'Bearer %s' % token
+        assert utils.getUserId(None, id_type='oauth')
+    per_call = (time.time() - start) / len(tokens) * 1000
+    print '%-28s %8.2f ms/call' % (label, per_call)
+
+
+def main():
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.init_memcache_stub()
+    tb.init_urlfetch_stub()
+    os.environ.pop('OAUTH_USER_ID', None)
+    startServer()
+    try:
+        tokens = [makeIdToken('user%08d' % i) for i in range(NUM_TOKENS)]
+        print '%d id_tokens, %.0f ms stand-in server latency' % (
+            NUM_TOKENS, SERVER_LATENCY * 1000)
+
+        settings.VERIFY_ID_TOKENS_LOCALLY = False
+        timeTokens('tokeninfo, cold', tokens)
+        timeTokens('tokeninfo, cached', tokens)
+
+        utils.TOKEN_CACHE.local.clear()
+        tb.get_stub(testbed.MEMCACHE_SERVICE_NAME).Clear()
+        settings.VERIFY_ID_TOKENS_LOCALLY = True
+        timeTokens('local verification, cold', tokens)
+        timeTokens('local verification, cached', tokens)
+    finally:
+        tb.deactivate()
+
+
+if __name__ == '__main__':
+    main()
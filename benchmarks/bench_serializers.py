@@ -0,0 +1,129 @@
+"""bench_serializers.py -- per-row cost of model-to-message copying
+
+Compares the old all_fields()/hasattr copy loop with the precompiled
+serializers on a few thousand in-memory entities (no datastore access).
+
+"""
+
+import random
+import time
+from datetime import date
+from datetime import time as dtime
+
+from benchmarks import setupSdk
+setupSdk()
+
+from google.appengine.ext import ndb
+
+from conference import CONFERENCE_SERIALIZER
+from conference import SESSION_SERIALIZER
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from models import Session
+from models import SessionForm
+
+NUM_ROWS = 5000
+REPEAT = 5
+
+
+def legacyCopyConferenceToForm(conf, displayName):
+    """The all_fields() loop used before serializers.py (minus the print)."""
+    cf = ConferenceForm()
+    for field in cf.all_fields():
+        if hasattr(conf, field.name):
+            if field.name.endswith('Date'):
+                setattr(cf, field.name, str(getattr(conf, field.name)))
+            else:
+                setattr(cf, field.name, getattr(conf, field.name))
+        elif field.name == "websafeKey":
+            setattr(cf, field.name, conf.key.urlsafe())
+    if displayName:
+        setattr(cf, 'organizerDisplayName', displayName)
+    cf.check_initialized()
+    return cf
+
+
+def legacyCopySessionToForm(session, speakerName):
+    """The all_fields() loop used before serializers.py (speaker pre-resolved)."""
+    sf = SessionForm()
+    for field in sf.all_fields():
+        if hasattr(session, field.name):
+            if field.name.endswith('date'):
+                setattr(sf, field.name, str(getattr(session, field.name)))
+            elif field.name.endswith('startTime'):
+                setattr(sf, field.name, str(getattr(session, field.name)))
+            elif field.name.endswith('speaker'):
+                setattr(sf, field.name, speakerName)
+            else:
+                setattr(sf, field.name, getattr(session, field.name))
+        elif field.name == "websafeConferenceKey":
+            setattr(sf, field.name, session.key.parent().urlsafe())
+        elif field.name == "websafeKey":
+            setattr(sf, field.name, session.key.urlsafe())
+    sf.check_initialized()
+    return sf
+
+
+def makeConferences(n):
+    p_key = ndb.Key(Profile, 'bench@example.com')
+    return [Conference(
+        key=ndb.Key(Conference, i + 1, parent=p_key),
+        name='Conference %d' % i,
+        description='Description of conference %d' % i,
+        organizerUserId='bench@example.com',
+        topics=['Topic %d' % (i % 7), 'Topic %d' % (i % 11)],
+        city='City %d' % (i % 50),
+        startDate=date(2016, 1 + i % 12, 1),
+        month=1 + i % 12,
+        endDate=date(2016, 1 + i % 12, 3),
+        maxAttendees=100,
+        seatsAvailable=random.randint(0, 100)) for i in range(n)]
+
+
+def makeSessions(conf_key, n):
+    return [Session(
+        key=ndb.Key(Session, i + 1, parent=conf_key),
+        name='Session %d' % i,
+        highlights=['highlight', 'another highlight'],
+        duration=60,
+        typeOfSession='lecture',
+        date=date(2016, 5, 1 + i % 28),
+        startTime=dtime(9 + i % 10, 0)) for i in range(n)]
+
+
+def timeRows(label, func, rows):
+    best = None
+    for _ in range(REPEAT):
+        start = time.time()
+        for row in rows:
+            func(row)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    per_row = best / len(rows) * 1e6
+    print '%-34s %8.1f us/row' % (label, per_row)
+    return per_row
+
+
+def main():
+    confs = makeConferences(NUM_ROWS)
+    sessions = makeSessions(confs[0].key, NUM_ROWS)
+
+    print '%d rows, best of %d runs' % (NUM_ROWS, REPEAT)
+    before = timeRows('conference: all_fields() loop',
+                      lambda c: legacyCopyConferenceToForm(c, 'Organizer'), confs)
+    after = timeRows('conference: serializer',
+                     lambda c: CONFERENCE_SERIALIZER.serialize(
+                         c, organizerDisplayName='Organizer'), confs)
+    print '%-34s %8.2fx' % ('conference speedup', before / after)
+
+    before = timeRows('session: all_fields() loop',
+                      lambda s: legacyCopySessionToForm(s, 'Speaker'), sessions)
+    after = timeRows('session: serializer',
+                     lambda s: SESSION_SERIALIZER.serialize(s, speaker='Speaker'),
+                     sessions)
+    print '%-34s %8.2fx' % ('session speedup', before / after)
+
+
+if __name__ == '__main__':
+    main()
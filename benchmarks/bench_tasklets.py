@@ -0,0 +1,249 @@
+"""bench_tasklets.py -- endpoints converted to tasklets against their
+synchronous versions
+
+getConference, getConferencesCreated, _doWishlist and _getSessionsInWishlist
+overlap their independent datastore reads.  This runs each of them and the
+synchronous version it replaced (reads one after another, as before the
+conversion) on the same synthetic dataset, and reports p50 / p99 latency
+and datastore RPCs per call.
+
+The testbed stubs answer an RPC in-process when it is waited on, so no two
+RPCs ever overlap.  With --latency every datastore RPC instead runs on its
+own thread after that many milliseconds, like a network round trip, so
+concurrent reads overlap as they do in production:
+
+    APPENGINE_SDK=... python -m benchmarks.bench_tasklets --latency 0,10
+
+"""
+
+import argparse
+import random
+import sys
+import threading
+import time
+
+from benchmarks import setupSdk
+setupSdk()
+
+import endpoints
+from google.appengine.api import apiproxy_rpc
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import counters
+import metrics
+import search
+from benchmarks.bench_endpoints import ROOT
+from benchmarks.bench_endpoints import _percentile
+from benchmarks.bench_endpoints import _wishlist
+from benchmarks.bench_endpoints import startRequest
+from benchmarks.dataset import DatasetSpec
+from benchmarks.dataset import generate
+from conference import CONF_GET_REQUEST
+from conference import CONFERENCE_CACHE
+from conference import FIELDS_PAGE_REQUEST
+from conference import PROFILE_FORM_CACHE
+from conference import SESSION_GET_REQUEST
+from conference import ConferenceApi
+from models import BooleanMessage
+from models import Conference
+from models import ConferenceForms
+from models import Profile
+from models import SessionForms
+from models import WishlistEntry
+from utils import getUserId
+
+ITERATIONS = 200
+
+
+# - - - synchronous versions - - - - - - - - - - - - - - - - - -
+
+def syncGetConference(api, request):
+    """getConference reading the conference, then its organizer's Profile."""
+    wsck = request.websafeConferenceKey
+    CONFERENCE_CACHE.get(wsck)
+    conf = ndb.Key(urlsafe=wsck).get()
+    if not conf:
+        raise endpoints.NotFoundException('No conference found with key: %s' % wsck)
+    prof = conf.key.parent().get()
+    cf = api._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+    cf.seatsAvailable = counters.getSeatsAvailable(conf)
+    return cf
+
+
+def syncGetConferencesCreated(api, request):
+    """getConferencesCreated running the query, then getting the Profile."""
+    p_key = ndb.Key(Profile, getUserId(endpoints.get_current_user()))
+    conferences, next_cursor = api._fetchPage(Conference.query(ancestor=p_key), request)
+    displayName = getattr(p_key.get(), 'displayName')
+    return ConferenceForms(
+        items=[api._copyConferenceToForm(conf, displayName) for conf in conferences],
+        nextCursor=next_cursor)
+
+
+def syncDoWishlist(api, request, add):
+    """_doWishlist getting the Profile, then the Session."""
+    wssk = request.websafeSessionKey
+    session_key = ndb.Key(urlsafe=wssk)
+    prof = api._getProfileFromUser()
+    if not session_key.get():
+        raise endpoints.NotFoundException('No Session found with key: %s' % wssk)
+    entry_key = ndb.Key(WishlistEntry, wssk, parent=prof.key)
+    if add:
+        WishlistEntry(key=entry_key, conference=session_key.parent()).put()
+    else:
+        entry_key.delete()
+    PROFILE_FORM_CACHE.delete(prof.key.id())
+    return BooleanMessage(data=True)
+
+
+def syncGetSessionsInWishlist(api, request):
+    """_getSessionsInWishlist getting the Profile, then the Conference."""
+    prof = api._getProfileFromUser()
+    conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+    if not conf:
+        raise endpoints.NotFoundException(
+            'No conference found with key: %s' % request.websafeConferenceKey)
+    entry_keys = WishlistEntry.query(
+        WishlistEntry.conference == conf.key, ancestor=prof.key).fetch(keys_only=True)
+    sessions = ndb.get_multi([ndb.Key(urlsafe=key.id()) for key in entry_keys])
+    return SessionForms(items=api._copySessionsToForms([s for s in sessions if s]))
+
+
+def comparisons(data, rnd):
+    """Return [(name, makeRequest, tasklet call, synchronous call)]."""
+    attendee = lambda: rnd.choice(data.profiles)
+    wsck = lambda: rnd.choice(data.conferenceKeys).urlsafe()
+    wssk = lambda: rnd.choice(data.sessionKeys[rnd.choice(data.conferenceKeys)]).urlsafe()
+
+    def conference():
+        request = CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=wsck())
+        # both versions read from the datastore, not the form cache
+        CONFERENCE_CACHE.delete(request.websafeConferenceKey)
+        return attendee(), request
+
+    return [
+        ('getConference', conference,
+         lambda api, r: api.getConference(r), syncGetConference),
+        ('getConferencesCreated',
+         lambda: (data.organizer, FIELDS_PAGE_REQUEST.combined_message_class(pageSize=20)),
+         lambda api, r: api.getConferencesCreated(r), syncGetConferencesCreated),
+        ('_doWishlist',
+         lambda: (attendee(), SESSION_GET_REQUEST.combined_message_class(
+             websafeSessionKey=wssk())),
+         lambda api, r: api._doWishlist(r, True),
+         lambda api, r: syncDoWishlist(api, r, True)),
+        ('_getSessionsInWishlist', lambda: _wishlist(data, rnd),
+         lambda api, r: api._getSessionsInWishlist(r), syncGetSessionsInWishlist),
+    ]
+
+
+# - - - simulated network latency - - - - - - - - - - - - - - - -
+
+class LatentRPC(apiproxy_rpc.RPC):
+    """LatentRPC -- stub RPC answered on its own thread after a delay"""
+
+    latency = 0.0
+
+    def _MakeCallImpl(self):
+        self._state = apiproxy_rpc.RPC.RUNNING
+        self._thread = threading.Thread(target=self._run)
+        self._thread.start()
+
+    def _run(self):
+        time.sleep(self.latency)
+        try:
+            self.stub.MakeSyncCall(self.package, self.call, self.request, self.response)
+        except Exception:
+            _, self._exception, self._traceback = sys.exc_info()
+
+    def _WaitImpl(self):
+        self._thread.join()
+        self._state = apiproxy_rpc.RPC.FINISHING
+        self._RPC__Callback()
+        return True
+
+
+def setLatency(ms):
+    """Delay every datastore RPC by ms milliseconds (0: the stub's own RPCs)."""
+    stub = apiproxy_stub_map.apiproxy.GetStub('datastore_v3')
+    if ms:
+        LatentRPC.latency = ms / 1000.0
+        stub.CreateRPC = lambda: LatentRPC(stub=stub)
+    else:
+        stub.__dict__.pop('CreateRPC', None)
+
+
+_rpcs = [0]
+
+
+def _countDatastoreRpc(service, call, request, response):
+    if service == 'datastore_v3':
+        _rpcs[0] += 1
+
+
+def timeCalls(api, call, makeRequest, iterations):
+    times = []
+    _rpcs[0] = 0
+    for _ in range(iterations):
+        email, request = makeRequest()
+        startRequest(email)
+        start = time.time()
+        call(api, request)
+        times.append((time.time() - start) * 1000)
+    return {
+        'p50 ms': round(_percentile(times, 0.5), 2),
+        'p99 ms': round(_percentile(times, 0.99), 2),
+        'datastore rpcs per call': round(float(_rpcs[0]) / iterations, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', type=int, default=1)
+    parser.add_argument('--iterations', type=int, default=ITERATIONS)
+    parser.add_argument('--latency', default='0,10',
+                        help='comma separated simulated datastore RPC latencies, in ms')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    tb = testbed.Testbed()
+    tb.activate()
+    tb.setup_env(app_id='dev~conference-bench', overwrite=True)
+    tb.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1))
+    tb.init_memcache_stub()
+    tb.init_taskqueue_stub(root_path=ROOT)
+    tb.init_app_identity_stub()
+    tb.init_mail_stub()
+    tb.init_user_stub()
+    metrics.installHooks()
+    metrics.PAYLOAD_SAMPLE_RATE = 0
+    apiproxy_stub_map.apiproxy.GetPostCallHooks().Append(
+        'bench_tasklets', _countDatastoreRpc)
+    search.setBackend(search.InvertedIndexBackend())
+    try:
+        data = generate(DatasetSpec.scaled(args.scale, seed=args.seed))
+        api = ConferenceApi()
+        print '%-24s %8s %12s %12s %12s %12s %9s %9s' % (
+            'method', 'latency', 'sync p50', 'tasklet p50', 'sync p99',
+            'tasklet p99', 'sync rpc', 'tasklet rpc')
+        for ms in [int(ms) for ms in args.latency.split(',')]:
+            setLatency(ms)
+            for name, makeRequest, tasklet_call, sync_call in comparisons(
+                    data, random.Random(args.seed)):
+                sync = timeCalls(api, sync_call, makeRequest, args.iterations)
+                tasklet = timeCalls(api, tasklet_call, makeRequest, args.iterations)
+                print '%-24s %6d ms %12.2f %12.2f %12.2f %12.2f %9.2f %9.2f' % (
+                    name, ms, sync['p50 ms'], tasklet['p50 ms'], sync['p99 ms'],
+                    tasklet['p99 ms'], sync['datastore rpcs per call'],
+                    tasklet['datastore rpcs per call'])
+        setLatency(0)
+    finally:
+        tb.deactivate()
+
+
+if __name__ == '__main__':
+    main()
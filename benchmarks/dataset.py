@@ -0,0 +1,200 @@
+"""dataset.py -- synthetic, reproducible datasets for the endpoint benchmarks
+
+generate(spec) writes conferences (with seat shards), sessions, speakers,
+profiles, registrations and wishlist entries straight into the (testbed)
+datastore.  All of them belong to one organizer.  It also writes a
+separate export conference holding spec.exportRows sessions and attendees.
+The same spec and seed always produce the same data.
+
+"""
+
+import random
+from datetime import date
+from datetime import time as dtime
+from datetime import timedelta
+
+from google.appengine.ext import ndb
+
+import counters
+from conference import ConferenceApi
+from models import Conference
+from models import Profile
+from models import Registration
+from models import Session
+from models import Speaker
+from models import SpeakerSessionCount
+from models import WishlistEntry
+
+PUT_BATCH_SIZE = 500
+ORGANIZER = 'organizer@example.com'
+CITIES = ['London', 'Paris', 'Tokyo', 'Chicago', 'Berlin', 'San Francisco']
+TOPICS = ['Medical Innovations', 'Programming Languages', 'Web Technologies',
+          'Movie Making', 'Health and Nutrition']
+SESSION_TYPES = ['lecture', 'workshop', 'keynote', 'panel']
+MAX_ATTENDEES = 10000
+
+
+class DatasetSpec(object):
+    """DatasetSpec -- sizes of a synthetic dataset"""
+
+    def __init__(self, conferences, sessionsPerConference, speakers, profiles,
+                 registrationsPerProfile, wishlistPerProfile, exportRows, seed=0):
+        self.conferences = conferences
+        self.sessionsPerConference = sessionsPerConference
+        self.speakers = speakers
+        self.profiles = profiles
+        self.registrationsPerProfile = registrationsPerProfile
+        self.wishlistPerProfile = wishlistPerProfile
+        self.exportRows = exportRows
+        self.seed = seed
+
+    @classmethod
+    def scaled(cls, scale, seed=0):
+        """Return the spec of a dataset growing linearly with scale."""
+        return cls(conferences=10 * scale,
+                   sessionsPerConference=20,
+                   speakers=5 * scale,
+                   profiles=20 * scale,
+                   registrationsPerProfile=3,
+                   wishlistPerProfile=5,
+                   exportRows=1000 * scale,
+                   seed=seed)
+
+    def toDict(self):
+        return dict(self.__dict__)
+
+
+class Dataset(object):
+    """Dataset -- keys of a generated dataset, kept current by the benchmarks"""
+
+    def __init__(self):
+        self.organizer = ORGANIZER
+        self.conferenceKeys = []
+        self.sessionKeys = {}           # conference key -> session keys
+        self.speakerKeys = []
+        self.profiles = []              # attendee emails
+        self.registrations = {}         # email -> set of conference keys
+        self.exportConferenceKey = None
+
+
+def _putAll(entities):
+    for i in range(0, len(entities), PUT_BATCH_SIZE):
+        ndb.put_multi(entities[i:i + PUT_BATCH_SIZE])
+
+
+def _sessions(rnd, conf_key, first_day, count, speaker_keys, speaker_names):
+    """Return Session and SpeakerSessionCount entities of a conference."""
+    sessions = []
+    counts = {}
+    for i in range(count):
+        speaker_key = rnd.choice(speaker_keys)
+        session = Session(
+            key=ndb.Key(Session, i + 1, parent=conf_key),
+            name='Session %d' % i,
+            highlights=['highlight %d' % rnd.randint(0, 9)],
+            speaker=speaker_key,
+            duration=rnd.choice([30, 45, 60, 90, 120]),
+            typeOfSession=rnd.choice(SESSION_TYPES),
+            date=first_day + timedelta(days=rnd.randint(0, 2)),
+            startTime=dtime(rnd.randint(8, 20), rnd.choice([0, 30])))
+        sessions.append(session)
+        count_entity = counts.get(speaker_key)
+        if count_entity is None:
+            count_entity = counts[speaker_key] = SpeakerSessionCount(
+                key=ndb.Key(SpeakerSessionCount, speaker_key.id(), parent=conf_key),
+                speaker=speaker_key,
+                speakerName=speaker_names[speaker_key],
+                sessionCount=0,
+                sessionNames=[])
+        count_entity.sessionCount += 1
+        if len(count_entity.sessionNames) < 10:
+            count_entity.sessionNames.append(session.name)
+    return sessions + counts.values()
+
+
+def generate(spec):
+    """Write the dataset described by spec; return its Dataset."""
+    rnd = random.Random(spec.seed)
+    data = Dataset()
+    entities = []
+
+    org_key = ndb.Key(Profile, ORGANIZER)
+    entities.append(Profile(key=org_key, displayName='Organizer', mainEmail=ORGANIZER))
+
+    speaker_names = {}
+    for i in range(spec.speakers):
+        name = 'Speaker %d' % i
+        key = ndb.Key(Speaker, ConferenceApi._speakerKeyName(name))
+        speaker_names[key] = name
+        entities.append(Speaker(key=key, name=name))
+    data.speakerKeys = sorted(speaker_names)
+
+    # profiles and the conferences they registered for
+    conf_keys = [ndb.Key(Conference, i + 1, parent=org_key) for i in range(spec.conferences)]
+    attendees = dict((key, 0) for key in conf_keys)
+    for i in range(spec.profiles):
+        email = 'user%d@example.com' % i
+        p_key = ndb.Key(Profile, email)
+        entities.append(Profile(key=p_key, displayName='User %d' % i, mainEmail=email))
+        registered = rnd.sample(conf_keys, min(spec.registrationsPerProfile, len(conf_keys)))
+        for conf_key in registered:
+            attendees[conf_key] += 1
+            entities.append(Registration(key=ndb.Key(Registration, conf_key.urlsafe(),
+                                                     parent=p_key),
+                                         conference=conf_key))
+        data.profiles.append(email)
+        data.registrations[email] = set(registered)
+
+    for i, conf_key in enumerate(conf_keys):
+        start = date(2016, 1, 1) + timedelta(days=rnd.randint(0, 360))
+        seats = MAX_ATTENDEES - attendees[conf_key]
+        shards = counters.createSeatShards(conf_key, seats)
+        entities.append(Conference(
+            key=conf_key,
+            name='Conference %d' % i,
+            description='Synthetic conference %d' % i,
+            organizerUserId=ORGANIZER,
+            topics=rnd.sample(TOPICS, 2),
+            city=rnd.choice(CITIES),
+            startDate=start,
+            month=start.month,
+            endDate=start + timedelta(days=2),
+            maxAttendees=MAX_ATTENDEES,
+            seatsAvailable=seats,
+            seatShards=len(shards)))
+        entities.extend(shards)
+        session_entities = _sessions(rnd, conf_key, start, spec.sessionsPerConference,
+                                     data.speakerKeys, speaker_names)
+        data.sessionKeys[conf_key] = [s.key for s in session_entities
+                                      if isinstance(s, Session)]
+        entities.extend(session_entities)
+    data.conferenceKeys = conf_keys
+
+    # wishlists hold sessions of registered conferences
+    for email in data.profiles:
+        p_key = ndb.Key(Profile, email)
+        for conf_key in sorted(data.registrations[email]):
+            sessions = data.sessionKeys[conf_key]
+            for session_key in rnd.sample(sessions, min(spec.wishlistPerProfile, len(sessions))):
+                entities.append(WishlistEntry(
+                    key=ndb.Key(WishlistEntry, session_key.urlsafe(), parent=p_key),
+                    conference=conf_key))
+    _putAll(entities)
+
+    # one large conference for the exports
+    export_key = ndb.Key(Conference, spec.conferences + 1, parent=org_key)
+    entities = [Conference(key=export_key, name='Export conference',
+                           organizerUserId=ORGANIZER, maxAttendees=spec.exportRows,
+                           seatsAvailable=0, startDate=date(2016, 6, 1), month=6)]
+    entities.extend(_sessions(rnd, export_key, date(2016, 6, 1), spec.exportRows,
+                              data.speakerKeys, speaker_names))
+    for i in range(spec.exportRows):
+        email = 'attendee%d@example.com' % i
+        p_key = ndb.Key(Profile, email)
+        entities.append(Profile(key=p_key, displayName='Attendee %d' % i, mainEmail=email))
+        entities.append(Registration(key=ndb.Key(Registration, export_key.urlsafe(),
+                                                 parent=p_key),
+                                     conference=export_key))
+    _putAll(entities)
+    data.exportConferenceKey = export_key
+    return data
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""caching.py
+
+Udacity conference server-side Python App Engine read-through caches
+
+LayeredCache keeps a small in-instance LRU with a TTL in front of memcache.
+The LRU is per instance, so its TTL bounds how stale an entry invalidated on
+another instance can be.  GenerationCache holds query results that are all
+invalidated at once by bumping a generation counter.
+
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from google.appengine.api import memcache
+
+
+class LRUCache(object):
+    """LRUCache -- thread-safe in-instance LRU cache with per-entry expiry"""
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value, or None if missing or expired."""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            # re-insert as most recently used
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Cache value for ttl seconds (default: the cache's ttl)."""
+        expires = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, expires)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class LayeredCache(object):
+    """LayeredCache -- in-instance LRU in front of memcache"""
+
+    def __init__(self, prefix, max_size=1000, local_ttl=10, memcache_ttl=60):
+        self.prefix = prefix
+        self.memcache_ttl = memcache_ttl
+        self.local = LRUCache(max_size, local_ttl)
+
+    def _memcacheKey(self, key):
+        return '%s %s' % (self.prefix, key)
+
+    def get(self, key):
+        """Return value from the LRU, else from memcache, else None."""
+        value = self.local.get(key)
+        if value is None:
+            value = memcache.get(self._memcacheKey(key))
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def get_multi(self, keys):
+        """Return dict of the cached values for keys, skipping misses."""
+        values = {}
+        for key in keys:
+            value = self.local.get(key)
+            if value is not None:
+                values[key] = value
+        missing = [key for key in keys if key not in values]
+        if missing:
+            found = memcache.get_multi(missing, key_prefix='%s ' % self.prefix)
+            for key, value in found.iteritems():
+                self.local.set(key, value)
+            values.update(found)
+        return values
+
+    def set(self, key, value, ttl=None):
+        """Cache value, for at most ttl seconds if given."""
+        if ttl is None:
+            memcache.set(self._memcacheKey(key), value, time=self.memcache_ttl)
+            self.local.set(key, value)
+        elif ttl > 0:
+            # memcache would keep a zero time forever
+            memcache.set(self._memcacheKey(key), value,
+                         time=min(ttl, self.memcache_ttl))
+            self.local.set(key, value, min(ttl, self.local.ttl))
+
+    def set_multi(self, mapping):
+        memcache.set_multi(mapping, time=self.memcache_ttl,
+                           key_prefix='%s ' % self.prefix)
+        for key, value in mapping.iteritems():
+            self.local.set(key, value)
+
+    def delete(self, key):
+        memcache.delete(self._memcacheKey(key))
+        self.local.delete(key)
+
+
+class GenerationCache(object):
+    """GenerationCache -- memcache results invalidated by a generation counter
+
+    Bumping the generation invalidates every entry at once.  Entries from an
+    older generation are still served for up to stale_ttl seconds while one
+    request (holding a short memcache lock) recomputes them.
+    """
+
+    def __init__(self, prefix, stale_ttl=60, memcache_ttl=600, lock_ttl=30):
+        self.prefix = prefix
+        self.stale_ttl = stale_ttl
+        self.memcache_ttl = memcache_ttl
+        self.lock_ttl = lock_ttl
+        self.generation_key = '%s GENERATION' % prefix
+
+    def generation(self):
+        """Return the current generation, starting one if memcache lost it."""
+        generation = memcache.get(self.generation_key)
+        if generation is None:
+            # seed from the clock so a lost counter never repeats an old value
+            memcache.add(self.generation_key, int(time.time() * 1000))
+            generation = memcache.get(self.generation_key)
+        return generation
+
+    def bump(self):
+        """Invalidate all entries."""
+        memcache.incr(self.generation_key, initial_value=int(time.time() * 1000))
+
+    def get(self, key, compute):
+        """Return the cached value for key, calling compute() to refresh it."""
+        memcache_key = '%s %s' % (self.prefix, key)
+        lock_key = '%s LOCK' % memcache_key
+        generation = self.generation()
+        entry = memcache.get(memcache_key)
+        locked = False
+        if entry is not None:
+            entry_generation, computed, value = entry
+            if entry_generation == generation:
+                return value
+            # stale: serve it while another request is refreshing it,
+            # unless it is too old to be served at all
+            if time.time() - computed < self.stale_ttl:
+                locked = memcache.add(lock_key, 1, time=self.lock_ttl)
+                if not locked:
+                    return value
+
+        value = compute()
+        memcache.set(memcache_key, (generation, time.time(), value),
+                     time=self.memcache_ttl)
+        if locked:
+            memcache.delete(lock_key)
+        return value
@@ -13,17 +13,24 @@ created by wesc on 2014 apr 21
 __author__ = 'wesc+api@google.com (Wesley Chun)'
 
 
+import hashlib
+import operator
+import random
 from datetime import datetime
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.ext import ndb
+from google.appengine.api import datastore_errors
 from google.appengine.api import memcache
-from google.appengine.api import taskqueue
+from google.appengine.datastore import entity_pb
 
+from models import AttendeeForm
+from models import AttendeeForms
 from models import Profile
 from models import ProfileMiniForm
 from models import ProfileForm
@@ -31,12 +38,17 @@ from models import TeeShirtSize
 from models import Conference
 from models import ConferenceForm
 from models import ConferenceForms
+from models import NearlySoldOut
+from models import Registration
 from models import Session
 from models import SessionForm
 from models import SessionForms
+from models import BulkSessionForms
 from models import SessionQueryForm
 from models import SessionByDateForm
+from models import SessionSearchForm
 from models import Speaker
+from models import SpeakerSessionCount
 from models import SpeakerForm
 from models import SpeakerForms
 from models import ConferenceQueryForm
@@ -44,15 +56,35 @@ from models import ConferenceQueryForms
 from models import BooleanMessage
 from models import ConflictException
 from models import StringMessage
+from models import WishlistEntry
 
 from settings import WEB_CLIENT_ID
 
 from utils import getUserId
 
+import counters
+import mailer
+import metrics
+import search
+import tasks
+from indexes import projectionFor
+from indexes import pushableEqualities
+from caching import GenerationCache
+from caching import LayeredCache
+from serializers import getSerializer
+
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
 MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT ANNOUNCEMENTS"
 MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED SPEAKER"
+MAX_PAGE_SIZE = 100
+MAX_FEATURED_SESSION_NAMES = 10
+NEARLY_SOLD_OUT_SEATS = 5
+MAX_BULK_ITEMS = 500
+SEARCH_PAGE_SIZE = 20
+BULK_PUT_CHUNK_SIZE = 100
+MIGRATION_BATCH_SIZE = 100
+NEARLY_SOLD_OUT_ID = "nearly sold out"
 
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
@@ -79,21 +111,129 @@ FIELDS = {
     'MAX_ATTENDEES': 'maxAttendees',
 }
 
+SESSION_FIELDS = {
+    'DATE': 'date',
+    'START_TIME': 'startTime',
+    'DURATION': 'duration',
+    'TYPE': 'typeOfSession',
+}
+
+# order in which a session filter is picked to run in the datastore:
+# equality before inequality, then by (usually) most selective field
+SESSION_FILTER_PRIORITY = ['date', 'startTime', 'duration', 'typeOfSession']
+
+COMPARATORS = {
+    '=':  operator.eq,
+    '>':  operator.gt,
+    '>=': operator.ge,
+    '<':  operator.lt,
+    '<=': operator.le,
+    '!=': operator.ne,
+}
+
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeConferenceKey=messages.StringField(1),
 )
 
-SPEAKER_GET_REQUEST = endpoints.ResourceContainer(
+SESSION_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeSessionKey=messages.StringField(1),
+)
+
+PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    cursor=messages.StringField(2),
+)
+
+CONF_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
+)
+
+# list endpoints taking a comma separated 'fields' mask
+FIELDS_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    pageSize=messages.IntegerField(1, variant=messages.Variant.INT32),
+    cursor=messages.StringField(2),
+    fields=messages.StringField(3),
+)
+
+CONF_FIELDS_PAGE_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
+    fields=messages.StringField(4),
+)
+
+SPEAKER_PAGE_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSpeakerKey=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
 )
 
-SESSION_GET_REQUEST = endpoints.ResourceContainer(
+CONF_SEARCH_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
-    websafeSessionKey=messages.StringField(1),
+    query=messages.StringField(1),
+    pageSize=messages.IntegerField(2, variant=messages.Variant.INT32),
+    cursor=messages.StringField(3),
 )
 
+SESSION_SEARCH_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    query=messages.StringField(1),
+    websafeConferenceKey=messages.StringField(2),
+    pageSize=messages.IntegerField(3, variant=messages.Variant.INT32),
+    cursor=messages.StringField(4),
+)
+
+PROFILE_SERIALIZER = getSerializer(Profile, ProfileForm)
+
+ATTENDEE_SERIALIZER = getSerializer(Profile, AttendeeForm)
+
+CONFERENCE_SERIALIZER = getSerializer(Conference, ConferenceForm,
+    websafeKey=lambda conf: conf.key.urlsafe())
+
+SPEAKER_SERIALIZER = getSerializer(Speaker, SpeakerForm,
+    websafeSpeakerKey=lambda speaker: speaker.key.urlsafe())
+
+SESSION_SERIALIZER = getSerializer(Session, SessionForm,
+    speaker=None,
+    websafeConferenceKey=lambda session: session.key.parent().urlsafe(),
+    websafeKey=lambda session: session.key.urlsafe())
+
+# serialized ConferenceForm by websafe key, read through by getConference()
+CONFERENCE_CACHE = LayeredCache('CONFERENCE FORM', max_size=500,
+                                local_ttl=10, memcache_ttl=60)
+
+# serialized queryConferences results by normalized filters; the
+# generation is bumped when conferences are created or seats change
+CONFERENCE_QUERY_CACHE = GenerationCache('CONFERENCE QUERY', stale_ttl=60)
+
+# user id -> Profile entity protobuf, read through by _getProfileFromUser();
+# ndb's in-context cache still serves repeated gets within one request
+PROFILE_CACHE = LayeredCache('PROFILE', max_size=2000,
+                             local_ttl=5, memcache_ttl=600)
+
+# user id -> serialized ProfileForm, read through by getProfile(); dropped
+# whenever the profile, its registrations or its wishlist change
+PROFILE_FORM_CACHE = LayeredCache('PROFILE FORM', max_size=2000,
+                                  local_ttl=5, memcache_ttl=600)
+
+# normalized speaker name -> websafe Speaker key
+SPEAKER_KEY_CACHE = LayeredCache('SPEAKER KEY', max_size=2000,
+                                 local_ttl=300, memcache_ttl=3600)
+
+# {normalized name: websafe key} of the Speakers created before speakers
+# were keyed by name, under a single key; no new ones are ever created
+LEGACY_SPEAKER_CACHE = LayeredCache('LEGACY SPEAKERS', max_size=1,
+                                    local_ttl=300, memcache_ttl=3600)
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 
@@ -104,36 +244,188 @@ SESSION_GET_REQUEST = endpoints.ResourceContainer(
 class ConferenceApi(remote.Service):
     """Conference API v0.1"""
 
+# - - - Paging - - - - - - - - - - - - - - - - - - - - - - - -
+
+    def _pageSize(self, request, default=None):
+        """Return validated page size of request, capped at MAX_PAGE_SIZE."""
+        if request.pageSize is not None and request.pageSize < 0:
+            raise endpoints.BadRequestException("'pageSize' must be positive.")
+        page_size = request.pageSize or default
+        if page_size is None:
+            return None
+        return min(page_size, MAX_PAGE_SIZE)
+
+
+    def _fetchPage(self, query, request, keysOnly=False):
+        """Return (entities, nextCursor) for query; paged only if pageSize given."""
+        return self._fetchPageAsync(query, request, keysOnly).get_result()
+
+
+    @ndb.tasklet
+    def _fetchPageAsync(self, query, request, keysOnly=False, projection=None):
+        """Tasklet version of _fetchPage(), to overlap with other reads."""
+        options = {'keys_only': keysOnly}
+        if projection:
+            options['projection'] = projection
+
+        # paging is opt-in: without a pageSize return the whole result set
+        if not request.pageSize:
+            if request.cursor:
+                raise endpoints.BadRequestException("'cursor' requires 'pageSize'.")
+            entities = yield query.fetch_async(**options)
+            raise ndb.Return((entities, None))
+
+        page_size = self._pageSize(request)
+
+        # resume from the cursor handed out with the previous page
+        try:
+            cursor = ndb.Cursor(urlsafe=request.cursor) if request.cursor else None
+            entities, next_cursor, more = yield query.fetch_page_async(
+                page_size, start_cursor=cursor, **options)
+        except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+            raise endpoints.BadRequestException("Invalid cursor: %s" % request.cursor)
+
+        if more and next_cursor:
+            raise ndb.Return((entities, next_cursor.urlsafe()))
+        raise ndb.Return((entities, None))
+
+
+    def _fieldMask(self, request, message_cls):
+        """Return the set of fields named by request's 'fields' mask, or
+        None to return every field.
+        """
+        if not request.fields:
+            return None
+        fields = set(f.strip() for f in request.fields.split(',') if f.strip())
+        unknown = fields - set(field.name for field in message_cls.all_fields())
+        if unknown:
+            raise endpoints.BadRequestException(
+                "Unknown field(s) in 'fields': %s" % ', '.join(sorted(unknown)))
+        return fields
+
+
+    def _fetchMaskedPage(self, query, request, model_cls, fields, **shape):
+        """Return (entities, nextCursor) for query, loading only what the
+        fields mask needs where possible.
+        """
+        return self._fetchMaskedPageAsync(
+            query, request, model_cls, fields, **shape).get_result()
+
+
+    @ndb.tasklet
+    def _fetchMaskedPageAsync(self, query, request, model_cls, fields, **shape):
+        """Tasklet version of _fetchMaskedPage().
+
+        Masks of key-derived fields only run a keys-only query.  Masks of
+        indexed, single-valued properties run a projection query if one of
+        the declared indexes serves it for the query shape (ancestor,
+        equality and sort properties, see indexes.projectionFor()).
+        Anything else loads full entities.
+        """
+        projection = None
+        if fields is not None:
+            properties = []
+            for name in fields:
+                prop = getattr(model_cls, name, None)
+                if isinstance(prop, ndb.Property):
+                    if prop._repeated or not prop._indexed:
+                        properties = None
+                        break
+                    properties.append(name)
+            if properties == []:
+                keys, next_cursor = yield self._fetchPageAsync(query, request, keysOnly=True)
+                raise ndb.Return(([model_cls(key=key) for key in keys], next_cursor))
+            if properties:
+                projection = projectionFor(model_cls._get_kind(), properties, **shape)
+        result = yield self._fetchPageAsync(query, request, projection=projection)
+        raise ndb.Return(result)
+
+
+    def _matchesFilters(self, entity, filters):
+        """Return True if entity passes all the (formatted) filters."""
+        for filtr in filters:
+            compare = COMPARATORS[filtr["operator"]]
+            value = getattr(entity, filtr["field"])
+            # a repeated property matches if any of its values does
+            values = value if isinstance(value, list) else [value]
+            # unset values never match an ordering comparison
+            if not any(compare(v, filtr["value"]) for v in values
+                       if v is not None or filtr["operator"] in ('=', '!=')):
+                return False
+        return True
+
+
+    def _fetchPostFilteredPage(self, query, postFilters, request,
+                               defaultPageSize=MAX_PAGE_SIZE):
+        """Return (entities, nextCursor): stream query through postFilters,
+        stopping as soon as one page of matches is collected.
+        """
+        # with defaultPageSize None an unpaged request gets all matches
+        page_size = self._pageSize(request, default=defaultPageSize)
+        if page_size is None and request.cursor:
+            raise endpoints.BadRequestException("'cursor' requires 'pageSize'.")
+        entities = []
+        try:
+            cursor = ndb.Cursor(urlsafe=request.cursor) if request.cursor else None
+            # cursors are only needed to page; '!=' queries only produce
+            # them when sorted on the key (see _getQuery())
+            results = query.iter(start_cursor=cursor,
+                                 produce_cursors=page_size is not None,
+                                 batch_size=page_size or MAX_PAGE_SIZE)
+            for entity in results:
+                if self._matchesFilters(entity, postFilters):
+                    entities.append(entity)
+                    if len(entities) == page_size:
+                        break
+        except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+            raise endpoints.BadRequestException("Invalid cursor: %s" % request.cursor)
+
+        # the cursor resumes right after the last entity looked at
+        if len(entities) == page_size and results.probably_has_next():
+            return entities, results.cursor_after().urlsafe()
+        return entities, None
+
+
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
         """Copy relevant fields from Profile to ProfileForm."""
-        # copy relevant fields from Profile to ProfileForm
-        pf = ProfileForm()
-        for field in pf.all_fields():
-            if hasattr(prof, field.name):
-                # convert t-shirt string to Enum; just copy others
-                if field.name == 'teeShirtSize':
-                    setattr(pf, field.name, getattr(TeeShirtSize, getattr(prof, field.name)))
-                else:
-                    setattr(pf, field.name, getattr(prof, field.name))
-        pf.check_initialized()
-        return pf
+        # registrations and wishlist entries are child entities keyed by
+        # websafe key; t-shirt string is converted to Enum by the serializer
+        registrations = Registration.query(ancestor=prof.key).fetch_async(keys_only=True)
+        wishlist = WishlistEntry.query(ancestor=prof.key).fetch_async(keys_only=True)
+        return PROFILE_SERIALIZER.serialize(
+            prof,
+            conferenceKeysToAttend=[key.id() for key in registrations.get_result()],
+            sessionKeysWishlist=[key.id() for key in wishlist.get_result()])
 
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if non-existent."""
+        return self._getProfileFromUserAsync().get_result()
+
+
+    @ndb.tasklet
+    def _getProfileFromUserAsync(self):
+        """Tasklet version of _getProfileFromUser(), to overlap with other reads."""
         user = endpoints.get_current_user()
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
 
         # get user id by calling getUserId(user)
         user_id = getUserId(user)
+
+        # cached entities are decoded per call, so callers may modify them
+        cached = PROFILE_CACHE.get(user_id)
+        if cached:
+            raise ndb.Return(self._decodeProfile(cached))
+
         # step 3. create a new key of kind Profile from the id
         p_key = ndb.Key(Profile, user_id)
 
-        # get the entity from datastore by using get() on the key
-        profile = p_key.get()
+        # get the entity from datastore by using get() on the key;
+        # PROFILE_CACHE is the memcache layer for profiles
+        profile = yield p_key.get_async(use_memcache=False)
         if not profile:
             profile = Profile(
                 key=p_key,
@@ -142,39 +434,118 @@ class ConferenceApi(remote.Service):
                 teeShirtSize=str(TeeShirtSize.NOT_SPECIFIED),
             )
             # save the profile to datastore
-            profile.put()
+            yield profile.put_async()
+        elif profile.conferenceKeysToAttend or profile.sessionKeysWishlist:
+            yield self._migrateProfileAsync(profile)
 
-        return profile      # return Profile
+        PROFILE_CACHE.set(user_id, self._encodeProfile(profile))
+        raise ndb.Return(profile)      # return Profile
+
+
+    @staticmethod
+    def _encodeProfile(prof):
+        """Return Profile as an encoded entity protobuf, for PROFILE_CACHE."""
+        return ndb.ModelAdapter().entity_to_pb(prof).Encode()
+
+
+    @staticmethod
+    def _decodeProfile(encoded):
+        """Return the Profile encoded by _encodeProfile()."""
+        return ndb.ModelAdapter().pb_to_entity(entity_pb.EntityProto(encoded))
+
+
+    @staticmethod
+    @ndb.tasklet
+    def _migrateProfileAsync(prof):
+        """Move legacy Profile.conferenceKeysToAttend/sessionKeysWishlist
+        into Registration/WishlistEntry entities.
+        """
+        entities = [Registration(key=ndb.Key(Registration, wsck, parent=prof.key),
+                                 conference=ndb.Key(urlsafe=wsck))
+                    for wsck in prof.conferenceKeysToAttend]
+        entities.extend(WishlistEntry(key=ndb.Key(WishlistEntry, wssk, parent=prof.key),
+                                      conference=ndb.Key(urlsafe=wssk).parent())
+                        for wssk in prof.sessionKeysWishlist)
+        prof.conferenceKeysToAttend = []
+        prof.sessionKeysWishlist = []
+        yield ndb.put_multi_async(entities + [prof])
+
+
+    @staticmethod
+    def _migrateProfiles(websafeCursor=None):
+        """Migrate the legacy lists of one batch of Profiles; return the
+        websafe cursor of the next batch, or None when done.  Used by
+        MigrateProfilesHandler() in main.py.
+        """
+        cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+        profiles, cursor, more = Profile.query().fetch_page(
+            MIGRATION_BATCH_SIZE, start_cursor=cursor)
+
+        @ndb.transactional
+        def _migrate(p_key):
+            # re-read: the user may have been migrated on a read meanwhile
+            prof = p_key.get()
+            if prof and (prof.conferenceKeysToAttend or prof.sessionKeysWishlist):
+                ConferenceApi._migrateProfileAsync(prof).get_result()
+
+        for prof in profiles:
+            if prof.conferenceKeysToAttend or prof.sessionKeysWishlist:
+                _migrate(prof.key)
+                # a cached copy still holding the lists must not be saved back
+                PROFILE_CACHE.delete(prof.key.id())
+                PROFILE_FORM_CACHE.delete(prof.key.id())
+        if more and cursor:
+            return cursor.urlsafe()
+        return None
 
 
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
-        # get user Profile
+        # get user Profile (possibly from PROFILE_CACHE)
         prof = self._getProfileFromUser()
+        user_id = prof.key.id()
 
         # if saveProfile(), process user-modifyable fields
         if save_request:
-            for field in ('displayName', 'teeShirtSize'):
-                if hasattr(save_request, field):
-                    val = getattr(save_request, field)
-                    if val:
-                        setattr(prof, field, str(val))
-            # TODO 4
-            # put the modified profile to datastore
-            prof.put()
+            prof = self._saveProfileTxn(prof.key, save_request)
+            PROFILE_CACHE.set(user_id, self._encodeProfile(prof))
+            PROFILE_FORM_CACHE.delete(user_id)
+        else:
+            cached = PROFILE_FORM_CACHE.get(user_id)
+            if cached:
+                return protojson.decode_message(ProfileForm, cached)
 
         # return ProfileForm
-        return self._copyProfileToForm(prof)
+        pf = self._copyProfileToForm(prof)
+        PROFILE_FORM_CACHE.set(user_id, protojson.encode_message(pf))
+        return pf
 
 
-    @endpoints.method(message_types.VoidMessage, ProfileForm,
+    @ndb.transactional
+    def _saveProfileTxn(self, p_key, save_request):
+        """Apply the user-modifyable fields of save_request to the stored
+        Profile and put it, returning the Profile.  The cached copy may be
+        stale, so the Profile is read from the datastore.
+        """
+        prof = p_key.get(use_cache=False, use_memcache=False)
+        for field in ('displayName', 'teeShirtSize'):
+            if hasattr(save_request, field):
+                val = getattr(save_request, field)
+                if val:
+                    setattr(prof, field, str(val))
+        # put the modified profile to datastore
+        prof.put()
+        return prof
+
+
+    @metrics.method(message_types.VoidMessage, ProfileForm,
             path='profile', http_method='GET', name='getProfile')
     def getProfile(self, request):
         """Return user profile."""
         return self._doProfile()
 
 
-    @endpoints.method(ProfileMiniForm, ProfileForm,
+    @metrics.method(ProfileMiniForm, ProfileForm,
             path='profile', http_method='POST', name='saveProfile')
     def saveProfile(self, request):
         """Update & return user profile."""
@@ -183,23 +554,14 @@ class ConferenceApi(remote.Service):
 
 # - - - Conference objects - - - - - - - - - - - - - - - - -
 
-    def _copyConferenceToForm(self, conf, displayName):
-        """Copy relevant fields from Conference to ConferenceForm."""
-        cf = ConferenceForm()
-        print conf
-        for field in cf.all_fields():
-            if hasattr(conf, field.name):
-                # convert Date to date string; just copy others
-                if field.name.endswith('Date'):
-                    setattr(cf, field.name, str(getattr(conf, field.name)))
-                else:
-                    setattr(cf, field.name, getattr(conf, field.name))
-            elif field.name == "websafeKey":
-                setattr(cf, field.name, conf.key.urlsafe())
+    def _copyConferenceToForm(self, conf, displayName, fields=None):
+        """Copy relevant fields (all, or those of the fields mask) from
+        Conference to ConferenceForm.
+        """
         if displayName:
-            setattr(cf, 'organizerDisplayName', displayName)
-        cf.check_initialized()
-        return cf
+            return CONFERENCE_SERIALIZER.serialize(
+                conf, fields, organizerDisplayName=displayName)
+        return CONFERENCE_SERIALIZER.serialize(conf, fields)
 
 
     def _createConferenceObject(self, request):
@@ -209,7 +571,37 @@ class ConferenceApi(remote.Service):
         if not user:
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
+        data = self._conferenceData(request, user_id)
+
+        # make Profile Key from user ID
+        p_key = ndb.Key(Profile, user_id)
+        # allocate new Conference ID with Profile key as parent
+        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
+        # make Conference key from ID
+        c_key = ndb.Key(Conference, c_id, parent=p_key)
+        data['key'] = c_key
 
+        # split the seats over the sharded seat counter
+        shards = counters.createSeatShards(c_key, data['seatsAvailable'])
+        data['seatShards'] = len(shards)
+
+        # create Conference, send email to organizer confirming
+        # creation of Conference & return (modified) ConferenceForm
+        conf = Conference(**data)
+        ndb.put_multi([conf] + shards)
+        CONFERENCE_QUERY_CACHE.bump()
+        search.indexConferences([conf])
+        if self._isNearlySoldOut(conf.seatsAvailable):
+            self._updateNearlySoldOut([conf], True)
+        self._addConfirmationEmailTasks(user, [conf], [request])
+
+        return request
+
+
+    def _conferenceData(self, request, user_id):
+        """Return Conference properties from ConferenceForm, filling in the
+        defaults on the form as well.
+        """
         if not request.name:
             raise endpoints.BadRequestException("Conference 'name' field required")
 
@@ -239,44 +631,110 @@ class ConferenceApi(remote.Service):
             data["seatsAvailable"] = data["maxAttendees"]
             setattr(request, "seatsAvailable", data["maxAttendees"])
 
-        # make Profile Key from user ID
-        p_key = ndb.Key(Profile, user_id)
-        # allocate new Conference ID with Profile key as parent
-        c_id = Conference.allocate_ids(size=1, parent=p_key)[0]
-        # make Conference key from ID
-        c_key = ndb.Key(Conference, c_id, parent=p_key)
-        data['key'] = c_key
         data['organizerUserId'] = request.organizerUserId = user_id
+        return data
 
-        # create Conference, send email to organizer confirming
-        # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
-        taskqueue.add(params={'email': user.email(),
-            'conferenceInfo': repr(request)},
-            url='/tasks/send_confirmation_email'
-        )
 
-        return request
+    def _bulkCreateConferenceObjects(self, request):
+        """Create many Conference objects with batched ID allocation, puts
+        and task enqueues, returning ConferenceForms.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
+        if len(request.items) > MAX_BULK_ITEMS:
+            raise endpoints.BadRequestException(
+                "At most %d conferences per request" % MAX_BULK_ITEMS)
+        datas = [self._conferenceData(item, user_id) for item in request.items]
+        if not datas:
+            return ConferenceForms()
+
+        # allocate the whole ID range with Profile key as parent at once
+        p_key = ndb.Key(Profile, user_id)
+        first, last = Conference.allocate_ids(size=len(datas), parent=p_key)
+
+        confs = []
+        entities = []
+        for c_id, data in zip(range(first, last + 1), datas):
+            data['key'] = ndb.Key(Conference, c_id, parent=p_key)
+            shards = counters.createSeatShards(data['key'], data['seatsAvailable'])
+            data['seatShards'] = len(shards)
+            confs.append(Conference(**data))
+            entities.append(confs[-1])
+            entities.extend(shards)
+        for i in range(0, len(entities), BULK_PUT_CHUNK_SIZE):
+            ndb.put_multi(entities[i:i + BULK_PUT_CHUNK_SIZE])
+
+        CONFERENCE_QUERY_CACHE.bump()
+        search.indexConferences(confs)
+        # one transaction and one announcement for the whole batch
+        nearly = [conf for conf in confs if self._isNearlySoldOut(conf.seatsAvailable)]
+        if nearly:
+            self._updateNearlySoldOut(nearly, True)
+
+        self._addConfirmationEmailTasks(user, confs, request.items)
+
+        for conf, item in zip(confs, request.items):
+            item.websafeKey = conf.key.urlsafe()
+        return ConferenceForms(items=request.items)
+
+
+    def _addConfirmationEmailTasks(self, user, confs, forms):
+        """Queue email to organizer confirming creation of each Conference."""
+        emails = []
+        for conf, form in zip(confs, forms):
+            context = {
+                'name': form.name,
+                'description': form.description or '',
+                'city': form.city or '',
+                'topics': ', '.join(form.topics),
+                'startDate': form.startDate or '',
+                'endDate': form.endDate or '',
+                'maxAttendees': form.maxAttendees,
+            }
+            # named after the conference, so a retried request sends one email
+            emails.append(('conference_created', user.email(), context,
+                           conf.key.urlsafe()))
+        mailer.queueEmails(emails)
 
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
+        """Return (query, postFilters, shape) planned from the submitted
+        filters; shape holds the query's pushed equality and sort properties.
+        """
         q = Conference.query()
         inequality_filter, filters = self._formatFilters(request.filters)
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
             q = q.order(Conference.name)
+            sort = ['name']
         else:
             q = q.order(ndb.GenericProperty(inequality_filter))
             q = q.order(Conference.name)
-
+            sort = [inequality_filter, 'name']
+            # '!=' runs as two datastore queries merged in memory, which can
+            # only be paged with cursors when sorted on the key last; the
+            # implicit __key__ column of every index serves it
+            if any(filtr["operator"] == "!=" for filtr in filters):
+                q = q.order(Conference.key)
+
+        # only push the equality filters a declared index can serve (see
+        # indexes.py); the others are applied while streaming the results
+        pushed = pushableEqualities(
+            'Conference',
+            [filtr["field"] for filtr in filters if filtr["operator"] == "="],
+            inequality_filter, ['name'])
+
+        post_filters = []
         for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
+            if filtr["operator"] == "=" and filtr["field"] not in pushed:
+                post_filters.append(filtr)
+                continue
             formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
             q = q.filter(formatted_query)
-        return q
+        return q, post_filters, {'equality': pushed, 'sort': sort}
 
 
     def _formatFilters(self, filters):
@@ -293,6 +751,13 @@ class ConferenceApi(remote.Service):
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
 
+            if filtr["field"] in ["month", "maxAttendees"]:
+                try:
+                    filtr["value"] = int(filtr["value"])
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Filter value must be a number: %s" % filtr["value"])
+
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
                 # check if inequality operation has been used in previous filters
@@ -307,29 +772,85 @@ class ConferenceApi(remote.Service):
         return (inequality_field, formatted_filters)
 
 
-    @endpoints.method(ConferenceForm, ConferenceForm, path='conference',
+    @metrics.method(ConferenceForm, ConferenceForm, path='conference',
             http_method='POST', name='createConference')
     def createConference(self, request):
         """Create new conference."""
         return self._createConferenceObject(request)
 
 
-    @endpoints.method(ConferenceQueryForms, ConferenceForms,
+    @metrics.method(ConferenceForms, ConferenceForms, path='conferences/bulk',
+            http_method='POST', name='bulkCreateConferences')
+    def bulkCreateConferences(self, request):
+        """Create many conferences in one call."""
+        return self._bulkCreateConferenceObjects(request)
+
+
+    @metrics.method(ConferenceQueryForms, ConferenceForms,
                 path='queryConferences',
                 http_method='POST',
                 name='queryConferences')
     def queryConferences(self, request):
         """Query for conferences."""
-        conferences = self._getQuery(request)
+        # the browse page repeats a few filter combinations; serve them
+        # from the result cache (stale-while-revalidate)
+        forms = CONFERENCE_QUERY_CACHE.get(
+            self._queryCacheKey(request),
+            lambda: protojson.encode_message(self._queryConferences(request)))
+        return protojson.decode_message(ConferenceForms, forms)
+
+
+    def _queryCacheKey(self, request):
+        """Return cache key for the normalized filters and page of request."""
+        inequality_filter, filters = self._formatFilters(request.filters)
+        # filter order and value types (str/unicode) must not matter
+        filters = sorted((f["field"], f["operator"], unicode(f["value"]))
+                         for f in filters)
+        fields = self._fieldMask(request, ConferenceForm)
+        key = repr((filters, self._pageSize(request), request.cursor,
+                    fields and sorted(fields)))
+        return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+    def _queryConferences(self, request):
+        """Run queryConferences() against the datastore."""
+        fields = self._fieldMask(request, ConferenceForm)
+        query, post_filters, shape = self._getQuery(request)
+        if post_filters:
+            # filtered in memory: needs full entities
+            conferences, next_cursor = self._fetchPostFilteredPage(
+                query, post_filters, request, defaultPageSize=None)
+        else:
+            conferences, next_cursor = self._fetchMaskedPage(
+                query, request, Conference, fields, **shape)
 
         # return individual ConferenceForm object per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, "") \
-            for conf in conferences]
+            items=[self._copyConferenceToForm(conf, "", fields) \
+            for conf in conferences],
+            nextCursor=next_cursor
+        )
+
+
+    @metrics.method(CONF_SEARCH_REQUEST, ConferenceForms,
+            path='conferences/search',
+            http_method='GET', name='searchConferences')
+    def searchConferences(self, request):
+        """Full-text search conference names, descriptions and topics."""
+        try:
+            conferences, next_cursor = search.searchConferences(
+                request.query, self._pageSize(request, SEARCH_PAGE_SIZE), request.cursor)
+        except ValueError:
+            raise endpoints.BadRequestException("Invalid 'cursor'")
+
+        # return ConferenceForms in rank order
+        return ConferenceForms(
+            items=[self._copyConferenceToForm(conf, "") for conf in conferences],
+            nextCursor=next_cursor
         )
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @metrics.method(FIELDS_PAGE_REQUEST, ConferenceForms,
             path='getConferencesCreated',
             http_method='POST', name='getConferencesCreated')
     def getConferencesCreated(self, request):
@@ -341,28 +862,35 @@ class ConferenceApi(remote.Service):
 
         # make profile key
         p_key = ndb.Key(Profile, getUserId(user))
-        # create ancestor query for this user
-        conferences = Conference.query(ancestor=p_key)
-        # get the user profile and display name
-        prof = p_key.get()
-        displayName = getattr(prof, 'displayName')
+        # run the ancestor query for this user and get the user profile
+        # (for the display name) concurrently
+        fields = self._fieldMask(request, ConferenceForm)
+        page_future = self._fetchMaskedPageAsync(
+            Conference.query(ancestor=p_key), request, Conference, fields, ancestor=True)
+        prof_future = p_key.get_async()
+        conferences, next_cursor = page_future.get_result()
+        displayName = getattr(prof_future.get_result(), 'displayName')
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(
-            items=[self._copyConferenceToForm(conf, displayName) for conf in conferences]
+            items=[self._copyConferenceToForm(conf, displayName, fields)
+                   for conf in conferences],
+            nextCursor=next_cursor
         )
 
 
-    @endpoints.method(message_types.VoidMessage, ConferenceForms,
+    @metrics.method(message_types.VoidMessage, ConferenceForms,
             path='conferences/attending',
             http_method='GET', name='getConferencesToAttend')
     def getConferencesToAttend(self, request):
         """Get list of conferences that user has registered for."""
         # get user profile
         prof = self._getProfileFromUser()
-        # get conferenceKeysToAttend from profile.
-        conf_keys = [ndb.Key(urlsafe=wsck) for wsck in prof.conferenceKeysToAttend]
+        # keys-only ancestor query for the user's registrations; their ids
+        # are the websafe Conference keys
+        reg_keys = Registration.query(ancestor=prof.key).fetch(keys_only=True)
+        conf_keys = [ndb.Key(urlsafe=reg_key.id()) for reg_key in reg_keys]
         # Use get_multi(array_of_keys) to fetch all keys at once.
-        conferences = ndb.get_multi(conf_keys)
+        conferences = [conf for conf in ndb.get_multi(conf_keys) if conf]
 
         # return set of ConferenceForm objects per Conference
         return ConferenceForms(items=[self._copyConferenceToForm(conf, "")\
@@ -371,71 +899,157 @@ class ConferenceApi(remote.Service):
 
 
     # Found on Udacity Forums as this endpoint was not mentioned in Lesson 4 Videos
-    @endpoints.method(CONF_GET_REQUEST, ConferenceForm,
+    @metrics.method(CONF_GET_REQUEST, ConferenceForm,
             path='conference/{websafeConferenceKey}',
             http_method='GET', name='getConference')
     def getConference(self, request):
         """Return requested conference (by websafeConferenceKey)."""
-        # get Conference object from request; bail if not found
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        # serve the cached ConferenceForm if there is one
+        wsck = request.websafeConferenceKey
+        cached = CONFERENCE_CACHE.get(wsck)
+        if cached:
+            return protojson.decode_message(ConferenceForm, cached)
+
+        # get Conference object and its parent Profile concurrently;
+        # bail if not found
+        conf_key = ndb.Key(urlsafe=wsck)
+        conf, prof = ndb.get_multi([conf_key, conf_key.parent()])
         if not conf:
-            raise endpoints.NotFoundException('No conference found with key: %s' % request.websafeConferenceKey)
-        prof = conf.key.parent().get()
-        # return ConferenceForm
-        return self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+            raise endpoints.NotFoundException('No conference found with key: %s' % wsck)
+        # return ConferenceForm with the live seat count
+        cf = self._copyConferenceToForm(conf, getattr(prof, 'displayName'))
+        cf.seatsAvailable = counters.getSeatsAvailable(conf)
+        CONFERENCE_CACHE.set(wsck, protojson.encode_message(cf))
+        return cf
+
+
+    @staticmethod
+    def _reconcileSeats(websafeConferenceKey):
+        """Copy sharded seat count into Conference.seatsAvailable; used by
+        ReconcileSeatsHandler() in main.py.
+        """
+        changed = counters.reconcileSeatsAvailable(
+            ndb.Key(urlsafe=websafeConferenceKey))
+        # query results show the denormalized seatsAvailable
+        if changed:
+            CONFERENCE_QUERY_CACHE.bump()
+        return changed
 
 
 # - - - Announcements - - - - - - - - - - - - - - - - - - - -
 
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
+    def _isNearlySoldOut(seats):
+        """Return True if seats is in the 'nearly sold out' range."""
+        return 0 < seats <= NEARLY_SOLD_OUT_SEATS
+
 
-        if confs:
+    @staticmethod
+    def _setAnnouncement(nearly):
+        """Format Announcement from NearlySoldOut & assign to memcache."""
+        if nearly and nearly.conferenceNames:
             # If there are almost sold out conferences,
             # format announcement and set it in memcache
             announcement = '%s %s' % (
                 'Last chance to attend! The following conferences '
                 'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+                ', '.join(nearly.conferenceNames))
         else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
+            # If there are no sold out conferences, cache the empty
+            # announcement so getAnnouncement() doesn't rebuild it
             announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
+        memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
         return announcement
 
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @staticmethod
+    def _updateNearlySoldOut(confs, add):
+        """Add confs to or remove them from the nearly sold out set in one
+        transaction; used when creation or registration moves conferences
+        across the threshold.
+        """
+        @ndb.transactional
+        def _update():
+            key = ndb.Key(NearlySoldOut, NEARLY_SOLD_OUT_ID)
+            nearly = key.get() or NearlySoldOut(key=key)
+            changed = False
+            for conf in confs:
+                if add and conf.key not in nearly.conferenceKeys:
+                    nearly.conferenceKeys.append(conf.key)
+                    nearly.conferenceNames.append(conf.name)
+                elif not add and conf.key in nearly.conferenceKeys:
+                    i = nearly.conferenceKeys.index(conf.key)
+                    del nearly.conferenceKeys[i]
+                    del nearly.conferenceNames[i]
+                else:
+                    continue
+                changed = True
+            if changed:
+                nearly.put()
+            return nearly
+        return ConferenceApi._setAnnouncement(_update())
+
+
+    @staticmethod
+    def _cacheAnnouncement():
+        """Reconcile nearly sold out set & assign Announcement to memcache;
+        used by memcache cron job.
+        """
+        key = ndb.Key(NearlySoldOut, NEARLY_SOLD_OUT_ID)
+        nearly = key.get() or NearlySoldOut(key=key)
+
+        # check the listed conferences plus any the denormalized seat
+        # count says are nearly sold out, against the live seat counters
+        conf_keys = set(nearly.conferenceKeys)
+        conf_keys.update(Conference.query(ndb.AND(
+            Conference.seatsAvailable <= NEARLY_SOLD_OUT_SEATS,
+            Conference.seatsAvailable > 0)
+        ).fetch(keys_only=True))
+        confs = dict((conf_key, conf) for conf_key, conf in
+                     zip(conf_keys, ndb.get_multi(list(conf_keys))))
+        checked = dict((conf_key, bool(conf) and ConferenceApi._isNearlySoldOut(
+                            counters.getSeatsAvailable(conf)))
+                       for conf_key, conf in confs.iteritems())
+
+        @ndb.transactional
+        def _reconcile():
+            # re-read the set: _updateNearlySoldOut() may have changed it
+            # since, and conferences it added after the check stay listed
+            nearly = key.get() or NearlySoldOut(key=key)
+            listed = zip(nearly.conferenceKeys, nearly.conferenceNames)
+            kept = [(conf_key, name) for conf_key, name in listed
+                    if checked.get(conf_key, True)]
+            kept.extend((conf_key, confs[conf_key].name)
+                        for conf_key in sorted(checked)
+                        if checked[conf_key] and conf_key not in nearly.conferenceKeys)
+            # nothing to reconcile: leave the entity alone
+            if kept == listed:
+                return nearly
+            nearly.conferenceKeys = [conf_key for conf_key, name in kept]
+            nearly.conferenceNames = [name for conf_key, name in kept]
+            nearly.put()
+            return nearly
+        return ConferenceApi._setAnnouncement(_reconcile())
+
+
+    @metrics.method(message_types.VoidMessage, StringMessage,
             path='conference/announcement/get',
             http_method='GET', name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        # TODO 1
-        # return an existing announcement from Memcache or an empty string.
+        # return an existing announcement from Memcache, rebuilding it
+        # from the nearly sold out set if it was evicted
         announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
-        print announcement
+        if announcement is None:
+            announcement = self._setAnnouncement(
+                ndb.Key(NearlySoldOut, NEARLY_SOLD_OUT_ID).get())
         return StringMessage(data=announcement)
 
 
 # - - - Registration - - - - - - - - - - - - - - - - - - - -
 
-    @ndb.transactional(xg=True)
     def _conferenceRegistration(self, request, reg):
         """Register or unregister user for selected conference."""
-        retval = None
-        prof = self._getProfileFromUser() # get user Profile
-
         # check if conf exists given websafeConfKey
         # get conference; check that it exists
         wsck = request.websafeConferenceKey
@@ -443,43 +1057,112 @@ class ConferenceApi(remote.Service):
         if not conf:
             raise endpoints.NotFoundException(
                 'No conference found with key: %s' % wsck)
+        if not conf.seatShards:
+            conf = counters.ensureSeatShards(conf.key)
+        # only the profile key is used: _registrationTxn() reads the
+        # Registration itself inside the transaction, bypassing all caches
+        reg_key = ndb.Key(Registration, wsck, parent=self._getProfileFromUser().key)
+
+        # register: take a seat from a random shard that still has one;
+        # retry on another shard if it ran out in the meantime
+        if reg:
+            for shard_key in counters.seatShardCandidates(conf):
+                try:
+                    retval = self._registrationTxn(reg_key, shard_key, reg)
+                    break
+                except counters.SeatShardEmpty:
+                    continue
+            else:
+                raise ConflictException(
+                    "There are no seats available.")
+
+        # unregister: give the seat back to any shard
+        else:
+            shard_key = random.choice(
+                counters.seatShardKeys(conf.key, conf.seatShards))
+            retval = self._registrationTxn(reg_key, shard_key, reg)
+
+        # refresh the denormalized Conference.seatsAvailable later on
+        # and drop the cached ConferenceForm with the old seat count
+        if retval:
+            PROFILE_FORM_CACHE.delete(reg_key.parent().id())
+            counters.scheduleSeatReconcile(conf.key)
+            CONFERENCE_CACHE.delete(wsck)
+            CONFERENCE_QUERY_CACHE.bump()
+
+            # keep the nearly sold out set current when this registration
+            # moved the conference across the threshold in either direction
+            seats = counters.getSeatsAvailable(conf)
+            previous = seats + 1 if reg else seats - 1
+            nearly = self._isNearlySoldOut(seats)
+            if nearly != self._isNearlySoldOut(previous):
+                self._updateNearlySoldOut([conf], nearly)
+        return BooleanMessage(data=retval)
+
+
+    @ndb.transactional(xg=True)
+    def _registrationTxn(self, reg_key, shard_key, reg):
+        """Write or delete user's Registration and update one seat shard in a
+        single transaction.
+        """
+        registration = reg_key.get()
 
         # register
         if reg:
             # check if user already registered otherwise add
-            if wsck in prof.conferenceKeysToAttend:
+            if registration:
                 raise ConflictException(
                     "You have already registered for this conference")
 
-            # check if seats avail
-            if conf.seatsAvailable <= 0:
-                raise ConflictException(
-                    "There are no seats available.")
-
             # register user, take away one seat
-            prof.conferenceKeysToAttend.append(wsck)
-            conf.seatsAvailable -= 1
-            retval = True
+            counters.adjustSeatShard(shard_key, -1)
+            Registration(key=reg_key, conference=ndb.Key(urlsafe=reg_key.id())).put()
 
         # unregister
         else:
             # check if user already registered
-            if wsck in prof.conferenceKeysToAttend:
+            if not registration:
+                return False
 
-                # unregister user, add back one seat
-                prof.conferenceKeysToAttend.remove(wsck)
-                conf.seatsAvailable += 1
-                retval = True
-            else:
-                retval = False
+            # unregister user, add back one seat
+            counters.adjustSeatShard(shard_key, 1)
+            reg_key.delete()
+
+        return True
 
-        # write things back to the datastore & return
-        prof.put()
-        conf.put()
-        return BooleanMessage(data=retval)
 
+    @metrics.method(CONF_PAGE_REQUEST, AttendeeForms,
+            path='conference/{websafeConferenceKey}/attendees',
+            http_method='GET', name='getConferenceAttendees')
+    def getConferenceAttendees(self, request):
+        """Return the attendee roster of a conference, one page at a time."""
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+
+        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        if not conf:
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % request.websafeConferenceKey)
+        # check that user is owner
+        if getUserId(user) != conf.organizerUserId:
+            raise endpoints.ForbiddenException(
+                'Only the owner can see the attendees.')
+
+        # page through the registrations for this conference; the
+        # attendee's Profile is the parent of each Registration
+        registrations = Registration.query(Registration.conference == conf.key)
+        registrations = registrations.order(Registration.created)
+        reg_keys, next_cursor = self._fetchPage(registrations, request, keysOnly=True)
+        profiles = ndb.get_multi([reg_key.parent() for reg_key in reg_keys])
+
+        return AttendeeForms(
+            items=[ATTENDEE_SERIALIZER.serialize(prof) for prof in profiles if prof],
+            nextCursor=next_cursor
+        )
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+
+    @metrics.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/{websafeConferenceKey}',
             http_method='POST', name='registerForConference')
     def registerForConference(self, request):
@@ -487,7 +1170,7 @@ class ConferenceApi(remote.Service):
         return self._conferenceRegistration(request, True)
 
 
-    @endpoints.method(CONF_GET_REQUEST, BooleanMessage,
+    @metrics.method(CONF_GET_REQUEST, BooleanMessage,
             path='conference/unregister/{websafeConferenceKey}',
             http_method='POST', name='unregisterFromConference')
     def unregisterFromConference(self, request):
@@ -497,35 +1180,86 @@ class ConferenceApi(remote.Service):
 
 # - - - Speaker objects - - - - - - - - - - - - - - - - - - - - - - -
 
-    def _createSpeakerObject(self, data):
-        """Create Speaker object, return Speaker key"""
-        # allocate new Speaker ID
-        speaker_id = Speaker.allocate_ids(size=1)[0]
-        # make Speaker key fom ID
-        speaker_key = ndb.Key(Speaker, speaker_id)
+    @staticmethod
+    def _speakerKeyName(name):
+        """Return normalized speaker name used as Speaker key name."""
+        return ' '.join(name.split()).lower()
+
+
+    def _getSpeakerKey(self, name):
+        """Return Speaker key for name, creating the Speaker if non-existent."""
+        return self._getSpeakerKeys([name])[self._speakerKeyName(name)]
+
+
+    def _getSpeakerKeys(self, names):
+        """Return {normalized name: Speaker key} for names, creating the
+        Speakers that don't exist yet, with batched RPCs.
+        """
+        # display name by normalized name
+        names = {self._speakerKeyName(name): ' '.join(name.split()) for name in names}
+        if '' in names:
+            raise endpoints.BadRequestException("Speaker name must not be blank")
+
+        # speakers seen before resolve without any RPC
+        speaker_keys = {key_name: ndb.Key(urlsafe=wssk) for key_name, wssk in
+                        SPEAKER_KEY_CACHE.get_multi(names.keys()).iteritems()}
+
+        # speakers are keyed by normalized name: strongly consistent gets
+        missing = [key_name for key_name in names if key_name not in speaker_keys]
+        for speaker in ndb.get_multi([ndb.Key(Speaker, key_name) for key_name in missing]):
+            if speaker:
+                speaker_keys[speaker.key.id()] = speaker.key
+
+        # fall back to speakers created before they were keyed by name
+        missing = [key_name for key_name in names if key_name not in speaker_keys]
+        if missing:
+            legacy = self._legacySpeakerKeys()
+            for key_name in missing:
+                if key_name in legacy:
+                    speaker_keys[key_name] = ndb.Key(urlsafe=legacy[key_name])
+
+        # create the rest; concurrent creators write the same entity
+        new_speakers = [Speaker(key=ndb.Key(Speaker, key_name), name=names[key_name])
+                        for key_name in names if key_name not in speaker_keys]
+        for speaker_key in ndb.put_multi(new_speakers):
+            speaker_keys[speaker_key.id()] = speaker_key
 
-        # Create Speaker and return Speaker key
-        speaker = Speaker(name=data,
-                          key=speaker_key)
-        speaker.put()
-        return speaker_key
+        SPEAKER_KEY_CACHE.set_multi(
+            {key_name: key.urlsafe() for key_name, key in speaker_keys.iteritems()})
+        return speaker_keys
 
 
 
+    @staticmethod
+    def _legacySpeakerKeys():
+        """Return {normalized name: websafe key} of the Speakers not keyed
+        by name; an empty dict once there are none.
+        """
+        legacy = LEGACY_SPEAKER_CACHE.get('all')
+        if legacy is not None:
+            return legacy
+
+        # integer ids sort before key names, so the legacy Speakers are the
+        # first ones in key order; without any, this reads one key
+        legacy = {}
+        query = Speaker.query().order(Speaker.key)
+        first = query.get(keys_only=True)
+        if first is not None and isinstance(first.id(), (int, long)):
+            for speaker in query.iter(batch_size=100):
+                if not isinstance(speaker.key.id(), (int, long)):
+                    break
+                legacy.setdefault(ConferenceApi._speakerKeyName(speaker.name),
+                                  speaker.key.urlsafe())
+        LEGACY_SPEAKER_CACHE.set('all', legacy)
+        return legacy
+
+
     def _copySpeakerToForm(self, speaker):
         """Copy relevant fields from Speaker to SpeakerForm."""
-        sf = SpeakerForm()
-        for field in sf.all_fields():
-            if hasattr(speaker, field.name):
-                setattr(sf, field.name, getattr(speaker, field.name))
-            # convert key to urlsafe
-            elif field.name == "websafeSpeakerKey":
-                setattr(sf, field.name, speaker.key.urlsafe())
-        sf.check_initialized()
-        return sf
-
-
-    @endpoints.method(message_types.VoidMessage, SpeakerForms,
+        return SPEAKER_SERIALIZER.serialize(speaker)
+
+
+    @metrics.method(PAGE_REQUEST, SpeakerForms,
                 path='querySpeakers',
                 http_method='GET',
                 name='querySpeakers')
@@ -533,12 +1267,14 @@ class ConferenceApi(remote.Service):
         """ Query for speakers.  Used to get urlsafe Speaker keys,
             which can then be used to query conferences by speaker
         """
-        speakers = Speaker.query().order(Speaker.name)
+        speakers, next_cursor = self._fetchPage(
+            Speaker.query().order(Speaker.name), request)
 
         # return individual SpeakerForm object per Speaker
         return SpeakerForms(
             items=[self._copySpeakerToForm(speaker) \
-            for speaker in speakers]
+            for speaker in speakers],
+            nextCursor=next_cursor
         )
 
 
@@ -552,106 +1288,198 @@ class ConferenceApi(remote.Service):
             raise endpoints.UnauthorizedException('Authorization required')
         user_id = getUserId(user)
 
-        # copy SpeakerForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
+        conf = self._getOwnedConference(request.websafeConferenceKey, user_id)
+        data = self._sessionData(request)
+
+        speakerNames = {}
+        if data['speaker']:
+            # store existing or newly created Speaker key as speaker
+            speakerNames = {self._getSpeakerKey(data['speaker']):
+                            ' '.join(data['speaker'].split())}
+            data['speaker'] = speakerNames.keys()[0]
 
+        # allocate new Session ID with Conference key as parent
+        s_id = Session.allocate_ids(size=1, parent=conf.key)[0]
+        # make Session key from ID
+        s_key = ndb.Key(Session, s_id, parent=conf.key)
+        # now I should be able to use s_key.parent() to access the parent Conference as well
+        data['key'] = s_key
+
+        # create Session & return SessionForm
+        session = Session(**data)
+        self._putSessionsTxn([session], speakerNames)
+        self._addFeaturedSpeakerTasks(conf.key, speakerNames.keys())
+        search.indexSessions([session])
+        return self._copySessionToForm(session, speakerNames)
+
+
+    def _getOwnedConference(self, websafeConferenceKey, user_id):
+        """Return Conference, checking that it exists and user_id owns it."""
         # get conference
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+        conf = ndb.Key(urlsafe=websafeConferenceKey).get()
         # check that conference exists
         if not conf:
             raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
+                'No conference found with key: %s' % websafeConferenceKey)
 
         # check that user is owner
         if user_id != conf.organizerUserId:
             raise endpoints.ForbiddenException(
                 'Only the owner can add sessions.')
+        return conf
+
 
+    def _sessionData(self, request):
+        """Return Session properties from SessionForm (speaker still a name)."""
         if not request.name:
             raise endpoints.BadRequestException("Session 'name' field required")
 
+        # copy SessionForm/ProtoRPC Message into dict
+        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
+        del data['websafeConferenceKey']
+        del data['websafeKey']
+
         # convert dates and times from strings to Date objects;
         if data['date']:
             data['date'] = datetime.strptime(data['date'][:10], "%Y-%m-%d").date()
 
         if data['startTime']:
             data['startTime'] = datetime.strptime(data['startTime'][:5], "%H:%M").time()
+        return data
 
-        if data['speaker']:
-            speaker = Speaker.query()
-            speaker = speaker.filter(Speaker.name == data['speaker']).get()
-            # Does this speaker already exist?
-            if speaker:
-                # store existing Speaker key as speaker
-                data['speaker'] = speaker.key
-            else:
-                # create new Speaker and store key
-                data['speaker'] = self._createSpeakerObject(data['speaker'])
-                speaker = data['speaker'].get()
-
-            # featured speaker task
-            taskqueue.add(
-                params={'websafeConferenceKey': request.websafeConferenceKey,
-                        'websafeSpeakerKey': speaker.key.urlsafe()},
-                url='/tasks/update_featured_speaker',
-                method='GET'
-            )
 
-        # allocate new Session ID with Conference key as parent
-        s_id = Session.allocate_ids(size=1, parent=conf.key)[0]
-        # make Session key from ID
-        s_key = ndb.Key(Session, s_id, parent=conf.key)
-        # now I should be able to use s_key.parent() to access the parent Conference as well
-        data['key'] = s_key
-        del data['websafeConferenceKey']
-        del data['websafeKey']
+    def _bulkCreateSessionObjects(self, request):
+        """Create many Session objects with batched ID allocation, speaker
+        resolution, puts and task enqueues, returning SessionForms.
+        """
+        user = endpoints.get_current_user()
+        if not user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        user_id = getUserId(user)
 
+        conf = self._getOwnedConference(request.websafeConferenceKey, user_id)
+        if len(request.items) > MAX_BULK_ITEMS:
+            raise endpoints.BadRequestException(
+                "At most %d sessions per request" % MAX_BULK_ITEMS)
+        datas = [self._sessionData(item) for item in request.items]
+        if not datas:
+            return SessionForms()
+
+        # resolve all speakers at once
+        speaker_keys = self._getSpeakerKeys(
+            [data['speaker'] for data in datas if data['speaker']])
+        speakerNames = {}
+        for data in datas:
+            if data['speaker']:
+                key = speaker_keys[self._speakerKeyName(data['speaker'])]
+                speakerNames[key] = ' '.join(data['speaker'].split())
+                data['speaker'] = key
+
+        # allocate the whole ID range with Conference key as parent at once
+        first, last = Session.allocate_ids(size=len(datas), parent=conf.key)
+        sessions = []
+        for s_id, data in zip(range(first, last + 1), datas):
+            data['key'] = ndb.Key(Session, s_id, parent=conf.key)
+            sessions.append(Session(**data))
+
+        # write in chunks, one transaction on the Conference entity group each
+        for i in range(0, len(sessions), BULK_PUT_CHUNK_SIZE):
+            self._putSessionsTxn(sessions[i:i + BULK_PUT_CHUNK_SIZE], speakerNames)
+        self._addFeaturedSpeakerTasks(conf.key, speakerNames.keys())
+        search.indexSessions(sessions)
+
+        return SessionForms(
+            items=[self._copySessionToForm(session, speakerNames) for session in sessions]
+        )
 
-        # create Session & return SessionForm
-        session_key = Session(**data).put()
-        return self._copySessionToForm(session_key.get())
-
-
-    def _copySessionToForm(self, session):
-        """Copy relevant fields from Session to SessionForm."""
-        sf = SessionForm()
-        for field in sf.all_fields():
-            if hasattr(session, field.name):
-                # convert date and time to strings;
-                if field.name.endswith('date'):
-                    setattr(sf, field.name, str(getattr(session, field.name)))
-                elif field.name.endswith('startTime'):
-                    setattr(sf, field.name, str(getattr(session, field.name)))
-                # convert Speaker url safe key to speaker name
-                elif field.name.endswith('speaker'):
-                    speaker_key = getattr(session, field.name)
-                    if speaker_key is not None:
-                        speaker = speaker_key.get()
-                        setattr(sf, field.name, speaker.name)
-                    else:
-                        setattr(sf, field.name, None)
-                # just copy others
-                else:
-                    setattr(sf, field.name, getattr(session, field.name))
-            # convert key to urlsafe
-            elif field.name == "websafeConferenceKey":
-                setattr(sf, field.name, session.key.parent().urlsafe())
-            elif field.name == "websafeKey":
-                setattr(sf, field.name, session.key.urlsafe())
-        sf.check_initialized()
-        return sf
+
+    @ndb.transactional
+    def _putSessionsTxn(self, sessions, speakerNames):
+        """Put Sessions of one Conference and bump their speakers' session counts."""
+        conf_key = sessions[0].key.parent()
+        speaker_keys = list(set(s.speaker for s in sessions if s.speaker is not None))
+        count_keys = [ndb.Key(SpeakerSessionCount, speaker_key.id(), parent=conf_key)
+                      for speaker_key in speaker_keys]
+
+        counts = {}
+        for speaker_key, count_key, count in zip(
+                speaker_keys, count_keys, ndb.get_multi(count_keys)):
+            if not count:
+                # first count for this speaker: start from the sessions already stored
+                stored = Session.query(ancestor=conf_key)
+                stored = stored.filter(Session.speaker == speaker_key).fetch()
+                count = SpeakerSessionCount(
+                    key=count_key,
+                    speaker=speaker_key,
+                    speakerName=' '.join(speakerNames[speaker_key].split()),
+                    sessionCount=len(stored),
+                    sessionNames=[s.name for s in stored][:MAX_FEATURED_SESSION_NAMES])
+            counts[speaker_key] = count
+
+        for session in sessions:
+            if session.speaker is not None:
+                count = counts[session.speaker]
+                count.sessionCount += 1
+                if len(count.sessionNames) < MAX_FEATURED_SESSION_NAMES:
+                    count.sessionNames.append(session.name)
+        ndb.put_multi(sessions + counts.values())
+
+
+    def _addFeaturedSpeakerTasks(self, conf_key, speaker_keys):
+        """Schedule featured speaker updates, coalesced per (conference, speaker)."""
+        wsck = conf_key.urlsafe()
+        items = []
+        for speaker_key in speaker_keys:
+            wssk = speaker_key.urlsafe()
+            items.append(('%s %s' % (wsck, wssk),
+                          {'websafeConferenceKey': wsck, 'websafeSpeakerKey': wssk}))
+        tasks.enqueue('featured_speaker', items)
+
+
+    def _copySessionsToForms(self, sessions, fields=None):
+        """Copy Sessions to SessionForms, resolving all speakers in one batch."""
+        sessions = list(sessions)
+        speakerNames = {}
+        if fields is None or 'speaker' in fields:
+            # collect the distinct speaker keys of the whole result set
+            speaker_keys = list(set(
+                session.speaker for session in sessions if session.speaker is not None))
+            speakers = ndb.get_multi(speaker_keys)
+            speakerNames = {speaker.key: speaker.name for speaker in speakers if speaker}
+        return [self._copySessionToForm(session, speakerNames, fields) for session in sessions]
+
+
+    def _copySessionToForm(self, session, speakerNames=None, fields=None):
+        """Copy relevant fields (all, or those of the fields mask) from
+        Session to SessionForm.
+        """
+        if fields is not None and 'speaker' not in fields:
+            return SESSION_SERIALIZER.serialize(session, fields)
+
+        # convert Speaker key to speaker name
+        speaker_name = None
+        if session.speaker is not None:
+            # use names resolved by _copySessionsToForms if given
+            if speakerNames is None:
+                speakerNames = {session.speaker: session.speaker.get().name}
+            speaker_name = speakerNames.get(session.speaker)
+        return SESSION_SERIALIZER.serialize(session, fields, speaker=speaker_name)
 
 
     def _doWishlist(self, request, add):
         """Add session to user wishlist."""
-        prof = self._getProfileFromUser()  # get user Profile
+        return self._doWishlistAsync(request, add).get_result()
+
 
+    @ndb.tasklet
+    def _doWishlistAsync(self, request, add):
+        """Add session to user wishlist; profile and session are read concurrently."""
         # check if session exists given websafeSessionKey
-        # get session; check that it exists
+        # get user Profile & session; check that session exists
         wssk = request.websafeSessionKey
         session_key = ndb.Key(urlsafe=wssk)
 
-        session = session_key.get()
+        prof, session = yield self._getProfileFromUserAsync(), session_key.get_async()
         if not session:
             raise endpoints.NotFoundException(
                 'No Session found with key: %s' % wssk)
@@ -661,54 +1489,51 @@ class ConferenceApi(remote.Service):
             raise ConflictException(
                 "Can only add Session objects to wishlist")
 
+        # wishlist entries are keyed by session: adding and removing
+        # are blind writes
+        entry_key = ndb.Key(WishlistEntry, wssk, parent=prof.key)
         if add:
-            # check if user already saved this session to wishlist
-            if wssk in prof.sessionKeysWishlist:
-                raise ConflictException(
-                    "This session is already in your wishlist")
-
             # save this session to user wishlist
-            prof.sessionKeysWishlist.append(wssk)
+            yield WishlistEntry(key=entry_key, conference=session_key.parent()).put_async()
         else:
-            if wssk not in prof.sessionKeysWishlist:
-                raise ConflictException(
-                    "This session is not in your wishlist")
-
             # remove from wishlist
-            prof.sessionKeysWishlist.remove(wssk)
+            yield entry_key.delete_async()
+        PROFILE_FORM_CACHE.delete(prof.key.id())
+
+        raise ndb.Return(BooleanMessage(data=True))
 
-        # write things back to the datastore & return
-        prof.put()
-        return BooleanMessage(data=True)
 
 
     def _getSessionsInWishlist(self, request):
         """Given a Confernce, return all session in user wishlist"""
-        prof = self._getProfileFromUser()  # get user Profile
+        return self._getSessionsInWishlistAsync(request).get_result()
 
-        # Get conference object
-        conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
+
+    @ndb.tasklet
+    def _getSessionsInWishlistAsync(self, request):
+        """Given a Confernce, return all session in user wishlist"""
+        # get user Profile and Conference object concurrently
+        prof, conf = yield (self._getProfileFromUserAsync(),
+                            ndb.Key(urlsafe=request.websafeConferenceKey).get_async())
         if not conf:
             raise endpoints.NotFoundException('No conference found with key: %s' % request.websafeConferenceKey)
 
-        # Get list of session keys from user profile
-        session_keys = [ndb.Key(urlsafe=wssk) for wssk in prof.sessionKeysWishlist]
-
-        # get all Sessions in wishlist
-        sessions = ndb.get_multi(session_keys)
-
-        # if the Session key parent is not the conference key, remove Session from sessions list
-        for session in sessions:
-            if session.key.parent() != conf.key:
-                sessions.remove(session)
+        # keys-only ancestor query for this conference's wishlist entries;
+        # their ids are the websafe Session keys
+        entry_keys = yield WishlistEntry.query(
+            WishlistEntry.conference == conf.key,
+            ancestor=prof.key).fetch_async(keys_only=True)
+        session_keys = [ndb.Key(urlsafe=entry_key.id()) for entry_key in entry_keys]
+        sessions = yield ndb.get_multi_async(session_keys)
+        sessions = [session for session in sessions if session]
 
         # return set of Session objects per Session
-        return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
-        )
+        raise ndb.Return(SessionForms(
+            items=self._copySessionsToForms(sessions)
+        ))
 
 
-    @endpoints.method(SessionForm, SessionForm,
+    @metrics.method(SessionForm, SessionForm,
             path='conference/{websafeConferenceKey}/session',
             http_method='POST', name='createSession')
     def createSession(self, request):
@@ -716,11 +1541,20 @@ class ConferenceApi(remote.Service):
         return self._createSessionObject(request)
 
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @metrics.method(BulkSessionForms, SessionForms,
+            path='conference/{websafeConferenceKey}/sessions/bulk',
+            http_method='POST', name='bulkCreateSessions')
+    def bulkCreateSessions(self, request):
+        """Create many sessions of a conference in one call."""
+        return self._bulkCreateSessionObjects(request)
+
+
+    @metrics.method(CONF_FIELDS_PAGE_REQUEST, SessionForms,
             path='{websafeConferenceKey}/sessions',
             http_method='GET', name='getConferenceSessions')
     def getConferenceSessions(self, request):
         """Given a conference, return all sessions"""
+        fields = self._fieldMask(request, SessionForm)
         conf = ndb.Key(urlsafe=request.websafeConferenceKey).get()
         if not conf:
             raise endpoints.NotFoundException('No conference found with key: %s' % request.websafeConferenceKey)
@@ -728,14 +1562,41 @@ class ConferenceApi(remote.Service):
         # create ancestor query for this conference
         sessions = Session.query(ancestor=conf.key)
         sessions = sessions.order(Session.date)
+        sessions, next_cursor = self._fetchMaskedPage(
+            sessions, request, Session, fields, ancestor=True, sort=['date'])
 
         # return set of Session objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=self._copySessionsToForms(sessions, fields),
+            nextCursor=next_cursor
+        )
+
+
+    @metrics.method(SESSION_SEARCH_REQUEST, SessionForms,
+            path='sessions/search',
+            http_method='GET', name='searchSessions')
+    def searchSessions(self, request):
+        """Full-text search session names and highlights, optionally within
+        one conference.
+        """
+        conf_key = None
+        if request.websafeConferenceKey:
+            conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        try:
+            sessions, next_cursor = search.searchSessions(
+                request.query, self._pageSize(request, SEARCH_PAGE_SIZE),
+                request.cursor, conf_key)
+        except ValueError:
+            raise endpoints.BadRequestException("Invalid 'cursor'")
+
+        # return SessionForms in rank order
+        return SessionForms(
+            items=self._copySessionsToForms(sessions),
+            nextCursor=next_cursor
         )
 
 
-    @endpoints.method(SessionQueryForm, SessionForms,
+    @metrics.method(SessionQueryForm, SessionForms,
                 path='{websafeConferenceKey}/querySessionsByType',
                 http_method='POST',
                 name='getConferenceSessionsByType')
@@ -748,14 +1609,16 @@ class ConferenceApi(remote.Service):
         sessions = Session.query(ancestor=conf.key)
         sessions = sessions.filter(Session.typeOfSession == request.typeOfSession)
         sessions = sessions.order(Session.date)
+        sessions, next_cursor = self._fetchPage(sessions, request)
 
         # return set of Session objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=self._copySessionsToForms(sessions),
+            nextCursor=next_cursor
         )
 
 
-    @endpoints.method(SPEAKER_GET_REQUEST, SessionForms,
+    @metrics.method(SPEAKER_PAGE_REQUEST, SessionForms,
                 path='speaker/{websafeSpeakerKey}',
                 http_method='POST',
                 name='getSessionsBySpeaker')
@@ -767,15 +1630,17 @@ class ConferenceApi(remote.Service):
                 'No Speaker found with key: %s' % request.websafeSpeakerKey)
         sessions = Session.query(Session.speaker == speaker)
         sessions = sessions.order(Session.date)
+        sessions, next_cursor = self._fetchPage(sessions, request)
 
         # return set of Session objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=self._copySessionsToForms(sessions),
+            nextCursor=next_cursor
         )
 
 
     # ADDITIONAL QUERY 1
-    @endpoints.method(SessionByDateForm, SessionForms,
+    @metrics.method(SessionByDateForm, SessionForms,
                 path='{websafeConferenceKey}/sessionsByDate',
                 http_method='GET',
                 name='getSessionsByDate')
@@ -786,25 +1651,27 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No Conference found with key: %s' % request.websafeConferenceKey)
 
-        # convert start and end date fields to date objects
+        # convert start and end date fields to date objects; either end
+        # of the range may be left open
+        sessions = Session.query(ancestor=conf)
         if request.startDate:
-            request.startDate = datetime.strptime(request.startDate[:10], "%Y-%m-%d").date()
+            start_date = datetime.strptime(request.startDate[:10], "%Y-%m-%d").date()
+            sessions = sessions.filter(Session.date >= start_date)
         if request.endDate:
-            request.endDate = datetime.strptime(request.endDate[:10], "%Y-%m-%d").date()
-
-        sessions = Session.query(ancestor=conf)
-        sessions = sessions.filter(Session.date >= request.startDate)
-        sessions = sessions.filter(Session.date <= request.endDate)
+            end_date = datetime.strptime(request.endDate[:10], "%Y-%m-%d").date()
+            sessions = sessions.filter(Session.date <= end_date)
         sessions = sessions.order(Session.date)
+        sessions, next_cursor = self._fetchPage(sessions, request)
 
         # return set of Session objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessions]
+            items=self._copySessionsToForms(sessions),
+            nextCursor=next_cursor
         )
 
 
     # ADDITIONAL QUERY 2
-    @endpoints.method(CONF_GET_REQUEST, SpeakerForms,
+    @metrics.method(CONF_GET_REQUEST, SpeakerForms,
                 path='{websafeConferenceKey}/speakers',
                 http_method='GET',
                 name='getSpeakersInConference')
@@ -815,17 +1682,16 @@ class ConferenceApi(remote.Service):
             raise endpoints.NotFoundException(
                 'No Conference found with key: %s' % request.websafeConferenceKey)
 
-        # get all Sessions in Conference
-        sessions = Session.query(ancestor=conf).fetch()
-        # initialize empty array to hold speakers
-        speakers = []
+        # distinct projection on Session.speaker: one row per speaker,
+        # however many sessions the conference has
+        sessions = Session.query(ancestor=conf, projection=[Session.speaker],
+                                 distinct=True).fetch()
+        speaker_keys = [session.speaker for session in sessions
+                        if session.speaker is not None]
 
-        # Append unique Speaker objects to speakers array
-        for session in sessions:
-            if session.speaker is not None:
-                speaker = session.speaker.get()
-                if speaker not in speakers:
-                    speakers.append(speaker)
+        # get all Speakers at once
+        speakers = [speaker for speaker in ndb.get_multi(speaker_keys) if speaker]
+        speakers.sort(key=lambda speaker: speaker.name)
 
         # return set of Speaker objects per Speaker
         return SpeakerForms(
@@ -833,8 +1699,83 @@ class ConferenceApi(remote.Service):
         )
 
 
+    def _formatSessionFilters(self, filters):
+        """Parse, check validity and format user supplied session filters."""
+        formatted_filters = []
+        for f in filters:
+            try:
+                field = SESSION_FIELDS[f.field]
+                op = OPERATORS[f.operator]
+            except KeyError:
+                raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+
+            # convert value to the type of the Session property
+            try:
+                if field == 'date':
+                    value = datetime.strptime(f.value[:10], "%Y-%m-%d").date()
+                elif field == 'startTime':
+                    value = datetime.strptime(f.value[:5], "%H:%M").time()
+                elif field == 'duration':
+                    value = int(f.value)
+                else:
+                    value = f.value
+            except (TypeError, ValueError):
+                raise endpoints.BadRequestException(
+                    "Invalid value for %s filter: %s" % (f.field, f.value))
+
+            formatted_filters.append({"field": field, "operator": op, "value": value})
+        return formatted_filters
+
+
+    def _planSessionQuery(self, query, filters):
+        """Push the most selective filter into query; return (query, postFilters)."""
+        # '!=' runs as two datastore queries, so it is always post-filtered
+        pushable = [f for f in filters if f["operator"] != '!=']
+        if not pushable:
+            return query, filters
+
+        best = min(pushable, key=lambda f: (
+            f["operator"] != '=', SESSION_FILTER_PRIORITY.index(f["field"])))
+        # push all filters on that field, e.g. both ends of a date range
+        pushed = [f for f in pushable if f["field"] == best["field"]]
+        prop = getattr(Session, best["field"])
+        for filtr in pushed:
+            query = query.filter(COMPARATORS[filtr["operator"]](prop, filtr["value"]))
+        if any(f["operator"] != '=' for f in pushed):
+            # the inequality property must be sorted on first
+            query = query.order(prop)
+
+        return query, [f for f in filters if f not in pushed]
+
+
+    def _querySessions(self, request, filters, defaultPageSize=MAX_PAGE_SIZE):
+        """Return (sessions, nextCursor) matching any number of inequality filters."""
+        if request.websafeConferenceKey:
+            query = Session.query(ancestor=ndb.Key(urlsafe=request.websafeConferenceKey))
+        else:
+            query = Session.query()
+        query, post_filters = self._planSessionQuery(query, filters)
+        return self._fetchPostFilteredPage(query, post_filters, request, defaultPageSize)
+
+
+    @metrics.method(SessionSearchForm, SessionForms,
+                path='querySessions',
+                http_method='POST',
+                name='querySessions')
+    def querySessions(self, request):
+        """Query sessions with inequality filters on several fields, one page at a time"""
+        sessions, next_cursor = self._querySessions(
+            request, self._formatSessionFilters(request.filters))
+
+        # return set of Session objects per Session
+        return SessionForms(
+            items=self._copySessionsToForms(sessions),
+            nextCursor=next_cursor
+        )
+
+
     # QUERY RELATED PROBLEM SOLUTION
-    @endpoints.method(message_types.VoidMessage, SessionForms,
+    @metrics.method(message_types.VoidMessage, SessionForms,
                 path='querysolution',
                 http_method='GET',
                 name='getSessionsByMultipleInequalities')
@@ -842,23 +1783,25 @@ class ConferenceApi(remote.Service):
         """Query all sessions before 7pm that are not workshops"""
 
         # This function is not supposed to be useful
-        # It only demonstrates how to filter my multiple inequalities
+        # It only demonstrates how to filter my multiple inequalities;
+        # querySessions() is the general version
 
         # create 7pm time object for filtering
         time = datetime.strptime('19:00', "%H:%M").time()
 
-        sessions = Session.query()
-        sessions = sessions.filter(Session.startTime <= time)
-
-        sessionsArray = [session for session in sessions if session.typeOfSession != 'workshop']
+        # a VoidMessage can't carry a cursor: return every match
+        sessions, next_cursor = self._querySessions(SessionSearchForm(), [
+            {"field": "startTime", "operator": "<=", "value": time},
+            {"field": "typeOfSession", "operator": "!=", "value": "workshop"},
+        ], defaultPageSize=None)
 
         # return set of Session objects per Session
         return SessionForms(
-            items=[self._copySessionToForm(session) for session in sessionsArray]
+            items=self._copySessionsToForms(sessions)
         )
 
 
-    @endpoints.method(SESSION_GET_REQUEST, BooleanMessage,
+    @metrics.method(SESSION_GET_REQUEST, BooleanMessage,
                 path='addsession/{websafeSessionKey}',
                 http_method='POST',
                 name='addSessionToWishlist')
@@ -867,7 +1810,7 @@ class ConferenceApi(remote.Service):
         return self._doWishlist(request, True)
 
 
-    @endpoints.method(SESSION_GET_REQUEST, BooleanMessage,
+    @metrics.method(SESSION_GET_REQUEST, BooleanMessage,
                 path='removesession/{websafeSessionKey}',
                 http_method='POST',
                 name='deleteSessionInWishlist')
@@ -876,7 +1819,7 @@ class ConferenceApi(remote.Service):
         return self._doWishlist(request, False)
 
 
-    @endpoints.method(CONF_GET_REQUEST, SessionForms,
+    @metrics.method(CONF_GET_REQUEST, SessionForms,
                 path='{websafeConferenceKey}/wishlist',
                 http_method='POST',
                 name='getSessionsInWishlist')
@@ -889,25 +1832,37 @@ class ConferenceApi(remote.Service):
 
     @staticmethod
     def _cacheFeaturedSpeaker(websafeConferenceKey, websafeSpeakerKey):
-        """Create Featured Speaker & assign to memcache; used by
-        SetFeaturedSpeaker() in main.py.
-        """
-        speaker_key = ndb.Key(urlsafe=websafeSpeakerKey)
-        conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+        """Create Featured Speaker & assign to memcache."""
+        ConferenceApi._cacheFeaturedSpeakers([(websafeConferenceKey, websafeSpeakerKey)])
 
-        sessions = Session.query(ancestor=conf_key)
-        sessions = sessions.filter(Session.speaker == speaker_key)
-        numberOfSessions = sessions.count()
 
-        if (numberOfSessions > 1):
-            sessions = sessions.fetch()
+    @staticmethod
+    def _cacheFeaturedSpeakers(pairs):
+        """Create Featured Speaker from a batch of (websafeConferenceKey,
+        websafeSpeakerKey) pairs & assign to memcache; used by
+        SetFeaturedSpeaker() in main.py.
+        """
+        # session count and names are maintained by _putSessionsTxn()
+        count_keys = []
+        for websafeConferenceKey, websafeSpeakerKey in pairs:
+            speaker_key = ndb.Key(urlsafe=websafeSpeakerKey)
+            conf_key = ndb.Key(urlsafe=websafeConferenceKey)
+            count_keys.append(ndb.Key(SpeakerSessionCount, speaker_key.id(), parent=conf_key))
+
+        # of the batch's speakers with more than one session, the one who
+        # most recently got a session is featured; the items come in
+        # dedupe key order, not in the order their sessions were added
+        featured = [count for count in ndb.get_multi(count_keys)
+                    if count and count.sessionCount > 1]
+        if featured:
+            latest = max(featured, key=lambda count: count.updated or datetime.min)
             string = "Don't miss out!  %s is speaking as the following conferences: %s" % (
-                speaker_key.get().name,
-                ', '.join(session.name for session in sessions))
+                latest.speakerName,
+                ', '.join(latest.sessionNames))
             memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, string)
 
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
+    @metrics.method(message_types.VoidMessage, StringMessage,
             path='speaker/featured/get',
             http_method='GET', name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
@@ -915,7 +1870,6 @@ class ConferenceApi(remote.Service):
         featured_speaker = memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY)
         if not featured_speaker:
             featured_speaker = ""
-        print featured_speaker
         return StringMessage(data=featured_speaker)
 
 # registers API
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""counters.py
+
+Udacity conference server-side Python App Engine sharded seat counters
+
+Registrations used to decrement Conference.seatsAvailable directly, so every
+registration for a popular conference contended on one entity group.  The
+seats are now spread over SeatShard root entities; a registration decrements
+one random shard and the total is the sum of all shards.
+Conference.seatsAvailable is kept as a denormalized copy for queries and is
+reconciled by /tasks/reconcile_seats.
+
+"""
+
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from models import SeatShard
+
+NUM_SEAT_SHARDS = 20
+MEMCACHE_SEATS_KEY = "SEATS AVAILABLE %s"
+SEATS_CACHE_TIME = 60
+RECONCILE_INTERVAL = 60
+
+
+class SeatShardEmpty(Exception):
+    """SeatShardEmpty -- the chosen shard ran out of seats in the meantime"""
+    pass
+
+
+def seatShardKeys(conf_key, num_shards):
+    """Return the SeatShard keys of a conference."""
+    return [ndb.Key(SeatShard, '%s-%d' % (conf_key.urlsafe(), i))
+            for i in range(num_shards)]
+
+
+def createSeatShards(conf_key, seats, num_shards=NUM_SEAT_SHARDS):
+    """Return (unsaved) SeatShard entities splitting seats across shards."""
+    # no point in having more shards than seats
+    num_shards = max(1, min(num_shards, seats))
+    per_shard, remainder = divmod(seats, num_shards)
+    return [SeatShard(key=key, seats=per_shard + (1 if i < remainder else 0))
+            for i, key in enumerate(seatShardKeys(conf_key, num_shards))]
+
+
+@ndb.transactional(xg=True)
+def ensureSeatShards(conf_key):
+    """Create shards for a conference created before seats were sharded."""
+    conf = conf_key.get()
+    if not conf.seatShards:
+        shards = createSeatShards(conf.key, conf.seatsAvailable or 0)
+        conf.seatShards = len(shards)
+        ndb.put_multi([conf] + shards)
+    return conf
+
+
+def seatShardCandidates(conf):
+    """Return keys of the shards that still have seats, in random order."""
+    keys = seatShardKeys(conf.key, conf.seatShards)
+    candidates = [shard.key for shard in ndb.get_multi(keys)
+                  if shard and shard.seats > 0]
+    random.shuffle(candidates)
+    return candidates
+
+
+def adjustSeatShard(shard_key, delta):
+    """Add delta seats to a shard; must run inside a transaction."""
+    shard = shard_key.get()
+    if shard.seats + delta < 0:
+        raise SeatShardEmpty(shard_key.id())
+    shard.seats += delta
+    shard.put()
+    # drop the cached total once the new seat count is committed
+    conf_urlsafe = shard_key.id().rsplit('-', 1)[0]
+    ndb.get_context().call_on_commit(
+        lambda: memcache.delete(MEMCACHE_SEATS_KEY % conf_urlsafe))
+    return shard
+
+
+def getSeatsAvailable(conf):
+    """Return the live number of available seats, cached in memcache."""
+    if not conf.seatShards:
+        return conf.seatsAvailable
+
+    memcache_key = MEMCACHE_SEATS_KEY % conf.key.urlsafe()
+    seats = memcache.get(memcache_key)
+    if seats is None:
+        shards = ndb.get_multi(seatShardKeys(conf.key, conf.seatShards))
+        seats = sum(shard.seats for shard in shards if shard)
+        memcache.add(memcache_key, seats, time=SEATS_CACHE_TIME)
+    return seats
+
+
+def scheduleSeatReconcile(conf_key):
+    """Enqueue at most one reconcile task per conference per interval."""
+    bucket = int(time.time()) // RECONCILE_INTERVAL
+    try:
+        taskqueue.add(
+            name='reconcile-seats-%s-%d' % (conf_key.urlsafe(), bucket),
+            params={'websafeConferenceKey': conf_key.urlsafe()},
+            url='/tasks/reconcile_seats',
+            countdown=RECONCILE_INTERVAL
+        )
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        # a reconcile for this interval is already pending
+        pass
+
+
+def reconcileSeatsAvailable(conf_key):
+    """Copy the sum of the seat shards into Conference.seatsAvailable;
+    return True if it changed.
+    """
+    conf = conf_key.get()
+    if not conf or not conf.seatShards:
+        return False
+    shards = ndb.get_multi(seatShardKeys(conf.key, conf.seatShards))
+    seats = sum(shard.seats for shard in shards if shard)
+    memcache.set(MEMCACHE_SEATS_KEY % conf.key.urlsafe(), seats,
+                 time=SEATS_CACHE_TIME)
+
+    @ndb.transactional
+    def _update():
+        conf = conf_key.get()
+        if conf.seatsAvailable == seats:
+            return False
+        conf.seatsAvailable = seats
+        conf.put()
+        return True
+    return _update()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+
+"""export.py
+
+Udacity conference server-side Python App Engine attendee & agenda export
+
+Rows are produced page by page with query cursors, bypassing ndb's caches,
+so reading an export only ever holds EXPORT_BATCH_SIZE entities however
+large the conference is.  The python27 runtime buffers the whole response
+body, though, and caps it at 32MB: ExportHandler in main.py refuses exports
+larger than MAX_RESPONSE_BYTES instead of failing half way.
+
+"""
+
+import csv
+import json
+from cStringIO import StringIO
+
+from google.appengine.ext import ndb
+
+from models import Registration
+from models import Session
+
+EXPORT_BATCH_SIZE = 500
+# the python27 runtime's response size limit
+MAX_RESPONSE_BYTES = 32 * 1024 * 1024
+
+ATTENDEE_COLUMNS = ['displayName', 'mainEmail', 'teeShirtSize', 'registered']
+SESSION_COLUMNS = ['name', 'speaker', 'typeOfSession', 'date', 'startTime',
+                   'duration', 'highlights', 'websafeKey']
+
+
+def _pages(query):
+    """Yield successive pages of query results, following cursors."""
+    cursor = None
+    more = True
+    while more:
+        # the in-context cache would otherwise keep every page read
+        entities, cursor, more = query.fetch_page(
+            EXPORT_BATCH_SIZE, start_cursor=cursor,
+            use_cache=False, use_memcache=False)
+        if entities:
+            yield entities
+
+
+def attendeeRows(conf_key):
+    """Yield one dict per registered attendee of a conference."""
+    registrations = Registration.query(Registration.conference == conf_key)
+    registrations = registrations.order(Registration.created)
+    for page in _pages(registrations):
+        profiles = ndb.get_multi([reg.key.parent() for reg in page],
+                                 use_cache=False, use_memcache=False)
+        for reg, prof in zip(page, profiles):
+            if prof:
+                yield {
+                    'displayName': prof.displayName,
+                    'mainEmail': prof.mainEmail,
+                    'teeShirtSize': prof.teeShirtSize,
+                    'registered': reg.created.isoformat() if reg.created else None,
+                }
+
+
+def sessionRows(conf_key):
+    """Yield one dict per session of a conference, in date order."""
+    sessions = Session.query(ancestor=conf_key).order(Session.date)
+    for page in _pages(sessions):
+        # resolve this page's speakers in one batch
+        speaker_keys = list(set(s.speaker for s in page if s.speaker is not None))
+        speakerNames = {speaker.key: speaker.name for speaker in ndb.get_multi(
+            speaker_keys, use_cache=False, use_memcache=False) if speaker}
+        for session in page:
+            yield {
+                'name': session.name,
+                'speaker': speakerNames.get(session.speaker),
+                'typeOfSession': session.typeOfSession,
+                'date': session.date.isoformat() if session.date else None,
+                'startTime': session.startTime.strftime('%H:%M') if session.startTime else None,
+                'duration': session.duration,
+                'highlights': '; '.join(session.highlights),
+                'websafeKey': session.key.urlsafe(),
+            }
+
+
+def _encode(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return '' if value is None else value
+
+
+def csvChunks(rows, columns):
+    """Yield CSV text in chunks of up to EXPORT_BATCH_SIZE rows."""
+    buf = StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(columns)
+    count = 0
+    for row in rows:
+        writer.writerow([_encode(row[column]) for column in columns])
+        count += 1
+        if count % EXPORT_BATCH_SIZE == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def ndjsonChunks(rows):
+    """Yield newline-delimited JSON in chunks of up to EXPORT_BATCH_SIZE rows."""
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row))
+        if len(lines) == EXPORT_BATCH_SIZE:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+EXPORTS = {
+    'attendees': (attendeeRows, ATTENDEE_COLUMNS),
+    'sessions': (sessionRows, SESSION_COLUMNS),
+}
+
+
+def exportChunks(what, conf_key, fmt):
+    """Return (content type, chunk generator) for an export."""
+    rows, columns = EXPORTS[what]
+    if fmt == 'ndjson':
+        return 'application/x-ndjson', ndjsonChunks(rows(conf_key))
+    return 'text/csv', csvChunks(rows(conf_key), columns)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""indexes.py
+
+Udacity conference server-side Python App Engine declared composite indexes
+
+Every composite index the app relies on is declared here, next to the query
+shapes it serves; index.yaml is generated from this list:
+
+    python indexes.py > index.yaml
+
+The conference query planner in conference.py only pushes filters into the
+datastore that one of these indexes can serve, so new filter fields don't
+grow the index set combinatorially.  Likewise a list endpoint's field mask
+is only served with a projection query when an index declared here covers it.
+
+"""
+
+import sys
+
+
+class Index(object):
+    """Index -- one declared composite index"""
+
+    def __init__(self, kind, properties, ancestor=False, shape=''):
+        self.kind = kind
+        self.properties = list(properties)
+        self.ancestor = ancestor
+        self.shape = shape
+
+    def __eq__(self, other):
+        return (self.kind, self.properties, self.ancestor) == \
+            (other.kind, other.properties, other.ancestor)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+INDEXES = [
+    # queryConferences: one (field, name) index per filterable field.  It
+    # serves an inequality on that field, and the datastore merge-joins any
+    # combination of them for equality filters sorted by name
+    Index('Conference', ['city', 'name'], shape='city filter, order by name'),
+    Index('Conference', ['topics', 'name'], shape='topics filter, order by name'),
+    Index('Conference', ['month', 'name'], shape='month filter, order by name'),
+    Index('Conference', ['maxAttendees', 'name'],
+          shape='maxAttendees filter, order by name'),
+    # list view field mask (name, city, startDate, maxAttendees,
+    # seatsAvailable) projected: queryConferences without filters, and
+    # getConferencesCreated
+    Index('Conference', ['name', 'city', 'startDate', 'maxAttendees', 'seatsAvailable'],
+          shape='order by name, list view projection'),
+    Index('Conference', ['name', 'city', 'startDate', 'maxAttendees', 'seatsAvailable'],
+          ancestor=True, shape='organizer, list view projection'),
+
+    # getConferenceAttendees: registrations of a conference in signup order
+    Index('Registration', ['conference', 'created'],
+          shape='conference =, order by created'),
+
+    # getSessionsBySpeaker
+    Index('Session', ['speaker', 'date'], shape='speaker =, order by date'),
+    # getConferenceSessions, getSessionsByDate, querySessions on date
+    Index('Session', ['date'], ancestor=True, shape='conference, order by date'),
+    # getConferenceSessions with the agenda field mask (name, date,
+    # startTime, typeOfSession, speaker) projected
+    Index('Session', ['date', 'name', 'startTime', 'typeOfSession', 'speaker'],
+          ancestor=True, shape='conference, order by date, agenda projection'),
+    # getConferenceSessionsByType
+    Index('Session', ['typeOfSession', 'date'], ancestor=True,
+          shape='conference, typeOfSession =, order by date'),
+    # getSpeakersInConference (distinct projection)
+    Index('Session', ['speaker'], ancestor=True,
+          shape='conference, distinct speaker'),
+    # querySessions inequality on startTime / duration within a conference
+    Index('Session', ['startTime'], ancestor=True,
+          shape='conference, startTime inequality'),
+    Index('Session', ['duration'], ancestor=True,
+          shape='conference, duration inequality'),
+    Index('Session', ['typeOfSession'], ancestor=True,
+          shape='conference, typeOfSession inequality'),
+]
+
+
+def indexesFor(kind):
+    """Return the declared indexes of an entity kind."""
+    return [index for index in INDEXES if index.kind == kind]
+
+
+def hasIndex(kind, properties, ancestor=False):
+    """Return True if a matching index is declared."""
+    return Index(kind, properties, ancestor) in INDEXES
+
+
+def pushableEqualities(kind, equality_fields, inequality_field, sort):
+    """Return the equality fields a query can filter on in the datastore.
+
+    Without an inequality every equality field with a (field, sort...)
+    index can be pushed: the datastore merge-joins those indexes.  With an
+    inequality a single index has to hold [equalities..., inequality,
+    sort...]; the declared index covering the most equality fields wins.
+    The remaining equality filters have to be applied in memory.
+    """
+    if inequality_field is None:
+        return [f for f in equality_fields if hasIndex(kind, [f] + sort)]
+
+    tail = [inequality_field] + [p for p in sort if p != inequality_field]
+    best = []
+    for index in indexesFor(kind):
+        if index.ancestor or index.properties[-len(tail):] != tail:
+            continue
+        prefix = index.properties[:-len(tail)]
+        if set(prefix) <= set(equality_fields) and len(prefix) >= len(best):
+            best = prefix
+    return [f for f in equality_fields if f in best]
+
+
+def projectionFor(kind, properties, ancestor=False, equality=(), sort=()):
+    """Return the properties to project for a query shape, or None if no
+    declared index can serve the projection.
+
+    The index has to hold the query's equality and sort properties followed
+    by exactly the remaining projected ones.  Properties with an equality
+    filter can't be projected.
+    """
+    properties = set(properties)
+    prefix = list(equality) + [p for p in sort if p not in equality]
+    if not properties or properties & set(equality):
+        return None
+    rest = properties - set(prefix)
+    for index in indexesFor(kind):
+        if index.ancestor == ancestor and \
+                index.properties[:len(prefix)] == prefix and \
+                len(index.properties) == len(prefix) + len(rest) and \
+                set(index.properties[len(prefix):]) == rest:
+            return sorted(properties)
+    return None
+
+
+def renderIndexYaml():
+    """Return index.yaml contents for the declared indexes."""
+    lines = [
+        'indexes:',
+        '',
+        '# Generated by `python indexes.py > index.yaml` from the query shapes',
+        '# declared in indexes.py; declare new indexes there, not here.',
+    ]
+    for index in INDEXES:
+        lines.append('')
+        lines.append('# %s' % index.shape)
+        lines.append('- kind: %s' % index.kind)
+        if index.ancestor:
+            lines.append('  ancestor: yes')
+        lines.append('  properties:')
+        for prop in index.properties:
+            lines.append('  - name: %s' % prop)
+    lines.extend([
+        '',
+        '# AUTOGENERATED',
+        '',
+        '# The dev_appserver adds indexes it needs below this line; any index',
+        '# showing up here is missing from indexes.py.',
+        '',
+    ])
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    sys.stdout.write(renderIndexYaml())
@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+
+"""mailer.py
+
+Udacity conference server-side Python App Engine outbound email worker
+
+Emails are queued as pull tasks on the 'mail' queue (see queue.yaml) holding
+a template name, a recipient and the template context.  MailWorker, run by
+cron, leases them in batches and renders each one from templates/email/.
+It sends them on a bounded number of threads and deletes the ones that
+were sent.  A failed email's lease is extended exponentially, so it is
+retried with backoff.
+
+The sender is injectable: StubSender records messages (with an optional
+simulated latency and failure rate) so the worker can be run and
+benchmarked against the local testbed.
+
+"""
+
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+from Queue import Empty
+from Queue import Queue
+from string import Template
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+from tasks import addTasks
+
+MAIL_QUEUE = 'mail'
+TEMPLATE_DIR = os.path.join(os.path.dirname(__file__), 'templates', 'email')
+
+LEASE_BATCH_SIZE = 100
+LEASE_SECONDS = 120
+MAX_CONCURRENT_SENDS = 10
+RUN_SECONDS = 50
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 6 * 3600
+MAX_ATTEMPTS = 10
+
+MEMCACHE_BATCHES_KEY = 'MAILER BATCHES'
+MAX_RECORDED_BATCHES = 50
+
+_templates = {}
+
+
+def queueEmails(emails):
+    """Queue (template, to, context, dedupe key) emails for the worker.
+
+    Emails with a dedupe key are named after it, so queueing the same key
+    twice sends one email.
+    """
+    tasks = []
+    for template, to, context, dedupe_key in emails:
+        name = None
+        if dedupe_key:
+            name = '%s-%s' % (template.replace('_', '-'),
+                              hashlib.md5(dedupe_key).hexdigest())
+        tasks.append(taskqueue.Task(
+            name=name,
+            method='PULL',
+            payload=json.dumps({'template': template, 'to': to, 'context': context})))
+    addTasks(tasks, queue_name=MAIL_QUEUE)
+
+
+def _loadTemplate(name):
+    if name not in _templates:
+        with open(os.path.join(TEMPLATE_DIR, '%s.txt' % name)) as f:
+            subject, body = f.read().decode('utf-8').split('\n\n', 1)
+        if not subject.startswith('Subject: '):
+            raise ValueError('Email template %s has no subject line' % name)
+        _templates[name] = (Template(subject[len('Subject: '):]), Template(body))
+    return _templates[name]
+
+
+def renderEmail(template, to, context):
+    """Return the message dict for an email."""
+    subject, body = _loadTemplate(template)
+    return {
+        'sender': 'noreply@%s.appspotmail.com' % app_identity.get_application_id(),
+        'to': to,
+        'subject': subject.safe_substitute(context),
+        'body': body.safe_substitute(context),
+    }
+
+
+def sendMail(message):
+    """Send a message dict with the Mail API."""
+    mail.send_mail(message['sender'], message['to'],
+                   message['subject'], message['body'])
+
+
+class StubSender(object):
+    """StubSender -- records messages instead of sending them"""
+
+    def __init__(self, latency=0, failure_rate=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.sent = []
+        self._lock = threading.Lock()
+
+    def __call__(self, message):
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.failure_rate:
+            raise mail.Error('Simulated send failure')
+        with self._lock:
+            self.sent.append(message)
+
+
+class MailWorker(object):
+    """MailWorker -- leases queued emails in batches and sends them"""
+
+    def __init__(self, sender=sendMail, queue_name=MAIL_QUEUE,
+                 concurrency=MAX_CONCURRENT_SENDS, batch_size=LEASE_BATCH_SIZE):
+        self.sender = sender
+        self.queue = taskqueue.Queue(queue_name)
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+
+
+    def run(self, seconds=RUN_SECONDS):
+        """Send batches until the queue is empty or time is up; return
+        the per-batch metrics.
+        """
+        deadline = time.time() + seconds
+        batches = []
+        while time.time() < deadline:
+            metrics = self.runBatch()
+            if not metrics:
+                break
+            batches.append(metrics)
+        return batches
+
+
+    def runBatch(self):
+        """Lease, send and settle one batch; return its metrics, or None
+        if there was nothing to send.
+        """
+        tasks = self.queue.lease_tasks(LEASE_SECONDS, self.batch_size)
+        if not tasks:
+            return None
+        start = time.time()
+
+        # render everything first: a task that can't be rendered never will be
+        messages = []
+        dropped = []
+        for task in tasks:
+            try:
+                payload = json.loads(task.payload)
+                messages.append((task, renderEmail(
+                    payload['template'], payload['to'], payload['context'])))
+            except (ValueError, KeyError, IOError):
+                logging.exception('Dropping unrenderable email task %s', task.name)
+                dropped.append(task)
+
+        errors = self._sendAll([message for task, message in messages])
+
+        done = list(dropped)
+        failed = 0
+        for (task, message), error in zip(messages, errors):
+            if error is None:
+                done.append(task)
+            elif task.retry_count >= MAX_ATTEMPTS:
+                logging.error('Giving up on email to %s after %d attempts: %s',
+                              message['to'], task.retry_count, error)
+                done.append(task)
+                failed += 1
+            else:
+                # back off exponentially by keeping the task leased longer
+                self.queue.modify_task_lease(task, min(
+                    BACKOFF_BASE_SECONDS * 2 ** task.retry_count, BACKOFF_MAX_SECONDS))
+                failed += 1
+        if done:
+            self.queue.delete_tasks(done)
+
+        elapsed = time.time() - start
+        metrics = {
+            'leased': len(tasks),
+            'sent': len(messages) - failed,
+            'failed': failed,
+            'dropped': len(dropped),
+            'seconds': round(elapsed, 3),
+            'perSecond': round((len(messages) - failed) / elapsed, 1) if elapsed else None,
+        }
+        self._recordBatch(metrics)
+        return metrics
+
+
+    def _sendAll(self, messages):
+        """Send messages on at most self.concurrency threads; return the
+        exception of each message, or None if it was sent.
+        """
+        work = Queue()
+        for i, message in enumerate(messages):
+            work.put((i, message))
+        errors = [None] * len(messages)
+
+        def _worker():
+            while True:
+                try:
+                    i, message = work.get_nowait()
+                except Empty:
+                    return
+                try:
+                    self.sender(message)
+                except Exception as e:
+                    errors[i] = e
+
+        threads = [threading.Thread(target=_worker)
+                   for _ in range(min(self.concurrency, len(messages)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return errors
+
+
+    @staticmethod
+    def _recordBatch(metrics):
+        logging.info('Mail batch: %s', metrics)
+        metrics['at'] = int(time.time())
+        # best effort: a concurrent worker may overwrite this batch's entry
+        batches = memcache.get(MEMCACHE_BATCHES_KEY) or []
+        batches.append(metrics)
+        memcache.set(MEMCACHE_BATCHES_KEY, batches[-MAX_RECORDED_BATCHES:])
+
+
+def recentBatches():
+    """Return the metrics of the most recent batches, oldest first."""
+    return memcache.get(MEMCACHE_BATCHES_KEY) or []
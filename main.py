@@ -1,41 +1,159 @@
 #!/usr/bin/env python
+import json
+import time
+
 import webapp2
 from google.appengine.api import app_identity
 from google.appengine.api import mail
+from google.appengine.api import users
+from google.appengine.ext import ndb
 from conference import ConferenceApi
+from export import MAX_RESPONSE_BYTES
+from export import exportChunks
+from mailer import MailWorker
+from mailer import recentBatches
+import metrics
+import search
+from tasks import addBatchTask
+from tasks import workItems
+from utils import getUserId
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
-        """Set Announcement in Memcache."""
-        # TODO 1
-        # use _cacheAnnouncement() to set announcement in Memcache
+        """Reconcile nearly sold out conferences & set Announcement in Memcache."""
         ConferenceApi._cacheAnnouncement()
 
 
+class SendEmailHandler(webapp2.RequestHandler):
+    def get(self):
+        """Send the emails queued on the mail pull queue."""
+        MailWorker().run()
+
+
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
-        """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+        """Send email confirming Conference creation, for push tasks queued
+        before confirmation emails moved to the mail pull queue.
+        """
+        for item in workItems(self.request):
+            mail.send_mail(
+                'noreply@%s.appspotmail.com' % (
+                    app_identity.get_application_id()),     # from
+                item['email'],                              # to
+                'You created a new Conference!',            # subj
+                'Hi, you have created a following '         # body
+                'conference:\r\n\r\n%s' % item['conferenceInfo']
+            )
 
 
 class SetFeaturedSpeaker(webapp2.RequestHandler):
+    def post(self):
+        """Set Featured Speaker in Memcache, for a batch of speakers."""
+        ConferenceApi._cacheFeaturedSpeakers(
+            [(item['websafeConferenceKey'], item['websafeSpeakerKey'])
+             for item in workItems(self.request)])
+        self.response.set_status(204)
+
+    # single-speaker GET tasks enqueued before batching
+    get = post
+
+
+class ReconcileSeatsHandler(webapp2.RequestHandler):
+    def post(self):
+        """Copy sharded seat count into Conference.seatsAvailable."""
+        ConferenceApi._reconcileSeats(self.request.get('websafeConferenceKey'))
+
+
+class StartMigrateProfilesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Start moving all legacy registration and wishlist lists into
+        Registration / WishlistEntry entities.
+        """
+        addBatchTask('/tasks/migrate_profiles', str(int(time.time())))
+        self.response.set_status(202)
+
+
+class MigrateProfilesHandler(webapp2.RequestHandler):
+    def post(self):
+        """Migrate one batch of Profiles and chain the next batch."""
+        cursor = ConferenceApi._migrateProfiles(self.request.get('cursor') or None)
+        if cursor:
+            addBatchTask('/tasks/migrate_profiles', self.request.get('run'), cursor)
+        self.response.set_status(204)
+
+
+class ExportHandler(webapp2.RequestHandler):
+    def get(self, what):
+        """Return a conference's attendees or sessions as CSV or NDJSON."""
+        user = users.get_current_user()
+        conf = ndb.Key(urlsafe=self.request.get('websafeConferenceKey')).get()
+        if not conf:
+            self.abort(404)
+        # only the organizer (or an app admin) may export
+        if not users.is_current_user_admin() and \
+                getUserId(user) != conf.organizerUserId:
+            self.abort(403)
+
+        fmt = self.request.get('format', 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            self.abort(400)
+        content_type, chunks = exportChunks(what, conf.key, fmt)
+        # the runtime buffers the response anyway: write it here, so an
+        # export over the response size limit fails with a clear status
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            if size > MAX_RESPONSE_BYTES:
+                self.response.clear()
+                self.abort(413, detail='Export larger than %d bytes' % MAX_RESPONSE_BYTES)
+            self.response.write(chunk)
+        self.response.content_type = content_type
+        self.response.headers['Content-Disposition'] = str(
+            'attachment; filename="%s.%s"' % (what, fmt))
+
+
+class MetricsHandler(webapp2.RequestHandler):
     def get(self):
-        """Set Featured Speaker in Memcache."""
-        ConferenceApi._cacheFeaturedSpeaker(self.request.get('websafeConferenceKey'),self.request.get('websafeSpeakerKey'))
+        """Return per-endpoint metrics and recent email batches as JSON."""
+        # counts of this instance are otherwise flushed on its next call
+        metrics.flush()
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps({
+            'methods': metrics.summary(),
+            'mailBatches': recentBatches(),
+        }, indent=2, sort_keys=True))
+
+
+class StartReindexSearchHandler(webapp2.RequestHandler):
+    def post(self):
+        """Start adding every Conference and Session to the search index."""
+        addBatchTask('/tasks/reindex_search', str(int(time.time())),
+                     kind=search.REINDEX_KINDS[0][0])
+        self.response.set_status(202)
+
+
+class ReindexSearchHandler(webapp2.RequestHandler):
+    def post(self):
+        """Index one batch of entities and chain the next batch."""
+        kind, cursor = search.reindexBatch(
+            self.request.get('kind'), self.request.get('cursor') or None)
+        if kind:
+            addBatchTask('/tasks/reindex_search', self.request.get('run'),
+                         cursor, kind=kind)
         self.response.set_status(204)
 
 
 app = webapp2.WSGIApplication([
     ('/crons/set_announcement', SetAnnouncementHandler),
+    ('/crons/send_email', SendEmailHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/update_featured_speaker', SetFeaturedSpeaker),
+    ('/tasks/reconcile_seats', ReconcileSeatsHandler),
+    ('/tasks/migrate_profiles', MigrateProfilesHandler),
+    ('/tasks/reindex_search', ReindexSearchHandler),
+    ('/export/(attendees|sessions)', ExportHandler),
+    ('/admin/metrics', MetricsHandler),
+    ('/admin/reindex_search', StartReindexSearchHandler),
+    ('/admin/migrate_profiles', StartMigrateProfilesHandler),
 ], debug=True)
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+"""metrics.py
+
+Udacity conference server-side Python App Engine per-endpoint metrics
+
+metrics.method is a drop-in for endpoints.method.  It records, per API
+method call:
+- wall time
+- API RPCs by service and call (datastore_v3.Get, datastore_v3.RunQuery, ...)
+- memcache hits and misses
+- response payload size, for a PAYLOAD_SAMPLE_RATE sample of calls
+
+These aggregate into in-instance counters and latency histograms.  Every
+FLUSH_INTERVAL seconds an instance adds its counts to the shared totals in
+memcache with one offset_multi; summary() reads the totals back for the
+/admin/metrics handler.
+
+"""
+
+import functools
+import random
+import threading
+import time
+
+import endpoints
+from protorpc import protojson
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+FLUSH_INTERVAL = 30
+MEMCACHE_PREFIX = 'METRICS '
+MEMCACHE_NAMES_KEY = 'METRICS NAMES'
+# share of calls whose response is encoded a second time to measure it
+PAYLOAD_SAMPLE_RATE = 0.05
+# wall time histogram bucket upper bounds, in milliseconds
+LATENCY_BUCKETS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+
+_local = threading.local()
+_lock = threading.Lock()
+_counts = {}
+_last_flush = [time.time()]
+
+
+def _rpcHook(service, call, request, response):
+    """Count an API call made while a metrics.method is running."""
+    stats = getattr(_local, 'stats', None)
+    if stats is None:
+        return
+    name = 'rpc %s.%s' % (service, call)
+    stats[name] = stats.get(name, 0) + 1
+    if service == 'memcache' and call == 'Get':
+        hits = response.item_size()
+        stats['memcache hits'] = stats.get('memcache hits', 0) + hits
+        stats['memcache misses'] = stats.get('memcache misses', 0) + \
+            request.key_size() - hits
+
+
+def installHooks():
+    """Register the RPC hook once per instance."""
+    hooks = apiproxy_stub_map.apiproxy.GetPostCallHooks()
+    hooks.Append('metrics', _rpcHook)
+
+installHooks()
+
+
+def _bucket(ms):
+    for bound in LATENCY_BUCKETS:
+        if ms <= bound:
+            return 'le %d' % bound
+    return 'le inf'
+
+
+def _record(method_name, stats):
+    with _lock:
+        for name, value in stats.iteritems():
+            key = '%s %s' % (method_name, name)
+            _counts[key] = _counts.get(key, 0) + value
+
+
+def instrumented(func):
+    """Record wall time, RPCs, memcache hits and payload size of func."""
+    @functools.wraps(func)
+    def wrapper(self, request):
+        _local.stats = stats = {}
+        start = time.time()
+        try:
+            response = func(self, request)
+        except Exception:
+            stats['errors'] = 1
+            raise
+        finally:
+            _local.stats = None
+            ms = (time.time() - start) * 1000
+            stats['calls'] = 1
+            stats['ms'] = int(ms)
+            stats[_bucket(ms)] = 1
+            _record(func.__name__, stats)
+        if random.random() < PAYLOAD_SAMPLE_RATE:
+            _record(func.__name__, {
+                'payload samples': 1,
+                'payload bytes': len(protojson.encode_message(response))})
+        maybeFlush()
+        return response
+    return wrapper
+
+
+def method(*args, **kwargs):
+    """endpoints.method that also records metrics.instrumented metrics."""
+    def decorator(func):
+        return endpoints.method(*args, **kwargs)(instrumented(func))
+    return decorator
+
+
+def maybeFlush():
+    """Flush the in-instance counts every FLUSH_INTERVAL seconds."""
+    if time.time() - _last_flush[0] >= FLUSH_INTERVAL:
+        flush()
+
+
+def takeCounts():
+    """Return and reset the in-instance counts."""
+    with _lock:
+        counts = dict(_counts)
+        _counts.clear()
+        _last_flush[0] = time.time()
+    return counts
+
+
+def flush():
+    """Add the in-instance counts to the totals in memcache."""
+    counts = takeCounts()
+    if not counts:
+        return
+    result = memcache.offset_multi(counts, key_prefix=MEMCACHE_PREFIX,
+                                   initial_value=0)
+    if None in result.itervalues():
+        # memcache is unavailable: keep the counts for the next flush
+        with _lock:
+            for key, value in counts.iteritems():
+                _counts[key] = _counts.get(key, 0) + value
+        return
+
+    # remember new counter names so summary() knows what to read
+    names = memcache.get(MEMCACHE_NAMES_KEY) or set()
+    if not set(counts) <= names:
+        memcache.set(MEMCACHE_NAMES_KEY, names | set(counts))
+
+
+def _percentile(buckets, calls, fraction):
+    """Return the histogram bucket bound holding the given fraction of calls."""
+    seen = 0
+    for bound in LATENCY_BUCKETS + ['inf']:
+        seen += buckets.get('le %s' % bound, 0)
+        if seen >= calls * fraction:
+            return bound
+    return 'inf'
+
+
+def summary():
+    """Return {method: stats} from the totals in memcache."""
+    names = memcache.get(MEMCACHE_NAMES_KEY) or set()
+    totals = memcache.get_multi(list(names), key_prefix=MEMCACHE_PREFIX)
+    methods = {}
+    for key, value in totals.iteritems():
+        method_name, name = key.split(' ', 1)
+        methods.setdefault(method_name, {})[name] = value
+
+    for stats in methods.itervalues():
+        calls = stats.get('calls', 0)
+        if not calls:
+            continue
+        buckets = dict((name, value) for name, value in stats.iteritems()
+                       if name.startswith('le '))
+        stats['mean ms'] = round(float(stats.get('ms', 0)) / calls, 1)
+        stats['p50 ms'] = _percentile(buckets, calls, 0.5)
+        stats['p99 ms'] = _percentile(buckets, calls, 0.99)
+        if stats.get('payload samples'):
+            stats['mean payload bytes'] = \
+                stats['payload bytes'] // stats['payload samples']
+    return methods
@@ -24,6 +24,7 @@ class Profile(ndb.Model):
     displayName = ndb.StringProperty()
     mainEmail = ndb.StringProperty()
     teeShirtSize = ndb.StringProperty(default='NOT_SPECIFIED')
+    # legacy lists, moved into Registration/WishlistEntry child entities
     conferenceKeysToAttend = ndb.StringProperty(repeated=True)
     sessionKeysWishlist = ndb.StringProperty(repeated=True)
 
@@ -74,6 +75,18 @@ class Conference(ndb.Model):
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
+    seatShards      = ndb.IntegerProperty(default=0, indexed=False)
+
+
+class NearlySoldOut(ndb.Model):
+    """NearlySoldOut -- conferences with only a few seats left (single entity)"""
+    conferenceKeys  = ndb.KeyProperty(Conference, repeated=True, indexed=False)
+    conferenceNames = ndb.StringProperty(repeated=True, indexed=False)
+
+
+class SeatShard(ndb.Model):
+    """SeatShard -- one shard of a Conference's available seat counter"""
+    seats = ndb.IntegerProperty(default=0, indexed=False)
 
 
 class ConferenceForm(messages.Message):
@@ -108,6 +121,7 @@ class SpeakerForm(messages.Message):
 class SpeakerForms(messages.Message):
     """SpeakerForms -- multiple Speaker outbound form message"""
     items = messages.MessageField(SpeakerForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
 
 
 class Session(ndb.Model):
@@ -121,6 +135,41 @@ class Session(ndb.Model):
     startTime       = ndb.TimeProperty()
 
 
+class Registration(ndb.Model):
+    """Registration -- user registered for a Conference (Profile as parent,
+    websafe Conference key as id)"""
+    conference      = ndb.KeyProperty(Conference)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class AttendeeForm(messages.Message):
+    """AttendeeForm -- Conference attendee outbound form message"""
+    displayName = messages.StringField(1)
+    mainEmail = messages.StringField(2)
+    teeShirtSize = messages.EnumField('TeeShirtSize', 3)
+
+
+class AttendeeForms(messages.Message):
+    """AttendeeForms -- multiple AttendeeForm outbound form message"""
+    items = messages.MessageField(AttendeeForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+
+
+class WishlistEntry(ndb.Model):
+    """WishlistEntry -- Session in a user's wishlist (Profile as parent,
+    websafe Session key as id)"""
+    conference      = ndb.KeyProperty(Conference)
+
+
+class SpeakerSessionCount(ndb.Model):
+    """SpeakerSessionCount -- a Speaker's Sessions in a Conference (Conference as parent)"""
+    speaker         = ndb.KeyProperty(Speaker)
+    speakerName     = ndb.StringProperty(indexed=False)
+    sessionCount    = ndb.IntegerProperty(default=0, indexed=False)
+    sessionNames    = ndb.StringProperty(repeated=True, indexed=False)
+    updated         = ndb.DateTimeProperty(auto_now=True, indexed=False)
+
+
 class SessionForm(messages.Message):
     """SessionForm -- Conference outbound form message"""
     name                    = messages.StringField(1)
@@ -137,12 +186,36 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionsForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
+
+
+class BulkSessionForms(messages.Message):
+    """BulkSessionForms -- multiple Session inbound form message for one Conference"""
+    websafeConferenceKey    = messages.StringField(1)
+    items                   = messages.MessageField(SessionForm, 2, repeated=True)
 
 
 class SessionQueryForm(messages.Message):
     """SessionQueryForm -- Session query inbound form message"""
     websafeConferenceKey    = messages.StringField(1)
     typeOfSession           = messages.StringField(2)
+    pageSize                = messages.IntegerField(3, variant=messages.Variant.INT32)
+    cursor                  = messages.StringField(4)
+
+
+class SessionFilterForm(messages.Message):
+    """SessionFilterForm -- Session query filter inbound form message"""
+    field = messages.StringField(1)
+    operator = messages.StringField(2)
+    value = messages.StringField(3)
+
+
+class SessionSearchForm(messages.Message):
+    """SessionSearchForm -- multiple SessionFilterForm inbound form message"""
+    websafeConferenceKey    = messages.StringField(1)
+    filters                 = messages.MessageField(SessionFilterForm, 2, repeated=True)
+    pageSize                = messages.IntegerField(3, variant=messages.Variant.INT32)
+    cursor                  = messages.StringField(4)
 
 
 class SessionByDateForm(messages.Message):
@@ -150,11 +223,14 @@ class SessionByDateForm(messages.Message):
     websafeConferenceKey    = messages.StringField(1)
     startDate               = messages.StringField(2)
     endDate                 = messages.StringField(3)
+    pageSize                = messages.IntegerField(4, variant=messages.Variant.INT32)
+    cursor                  = messages.StringField(5)
 
 
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextCursor = messages.StringField(2)
 
 
 class ConferenceQueryForm(messages.Message):
@@ -167,6 +243,9 @@ class ConferenceQueryForm(messages.Message):
 class ConferenceQueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(ConferenceQueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    cursor = messages.StringField(3)
+    fields = messages.StringField(4)
 
 
 # needed for conference registration
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""search.py
+
+Udacity conference server-side Python App Engine full-text search
+
+Conferences are indexed on name, description and topics, sessions on name
+and highlights, with the websafe entity key as document id.  Searches
+match every query word and rank by relevance; pages are continued with an
+opaque cursor string.
+
+Two backends implement index/search:
+- SearchApiBackend: the App Engine Search API, used by default.
+- InvertedIndexBackend: an in-process inverted index for tests and
+  benchmarks.  Install it with setBackend().
+
+"""
+
+import logging
+import math
+import re
+import threading
+
+from google.appengine.api import search as search_api
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import Session
+
+# field weights when ranking: a match in the name beats one in the text
+CONFERENCE_FIELDS = {'name': 3.0, 'topics': 2.0, 'description': 1.0}
+SESSION_FIELDS = {'name': 3.0, 'highlights': 1.0}
+# the Search API takes at most 200 documents per put
+PUT_BATCH_SIZE = 200
+REINDEX_BATCH_SIZE = 200
+
+
+def tokenize(text):
+    """Return the lowercased words of text."""
+    return re.findall(r'\w+', text.lower(), re.UNICODE)
+
+
+def conferenceDocument(conf):
+    """Return (doc id, fields, parent) of a Conference."""
+    return conf.key.urlsafe(), {
+        'name': conf.name or '',
+        'description': conf.description or '',
+        'topics': ' '.join(conf.topics),
+    }, None
+
+
+def sessionDocument(session):
+    """Return (doc id, fields, parent) of a Session; parent is the
+    websafe Conference key.
+    """
+    return session.key.urlsafe(), {
+        'name': session.name or '',
+        'highlights': ' '.join(session.highlights),
+    }, session.key.parent().urlsafe()
+
+
+class InvertedIndexBackend(object):
+    """InvertedIndexBackend -- in-process inverted index with TF-IDF ranking"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # kind -> word -> doc id -> {field: term frequency}
+        self._postings = {}
+        # kind -> doc id -> (words, parent)
+        self._docs = {}
+
+    def index(self, kind, documents):
+        with self._lock:
+            postings = self._postings.setdefault(kind, {})
+            docs = self._docs.setdefault(kind, {})
+            for doc_id, fields, parent in documents:
+                self._remove(kind, doc_id)
+                words = set()
+                for field, text in fields.iteritems():
+                    for word in tokenize(text):
+                        tf = postings.setdefault(word, {}).setdefault(doc_id, {})
+                        tf[field] = tf.get(field, 0) + 1
+                        words.add(word)
+                docs[doc_id] = (words, parent)
+
+    def _remove(self, kind, doc_id):
+        words, parent = self._docs[kind].pop(doc_id, (set(), None))
+        for word in words:
+            postings = self._postings[kind][word]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[kind][word]
+
+    def search(self, kind, words, weights, limit, cursor=None, parent=None):
+        with self._lock:
+            postings = self._postings.get(kind, {})
+            docs = self._docs.get(kind, {})
+            matches = [postings.get(word, {}) for word in words]
+            # every word has to match; start from the rarest one
+            matches.sort(key=len)
+            candidates = set(matches[0]) if matches else set()
+            for match in matches[1:]:
+                candidates.intersection_update(match)
+            if parent is not None:
+                candidates = set(doc_id for doc_id in candidates
+                                 if docs[doc_id][1] == parent)
+            if not candidates:
+                return [], None
+
+            scores = {}
+            for match in matches:
+                idf = math.log(1.0 + len(docs) / float(len(match)))
+                for doc_id in candidates:
+                    tf = sum(weights.get(field, 1.0) * count
+                             for field, count in match[doc_id].iteritems())
+                    scores[doc_id] = scores.get(doc_id, 0) + tf * idf
+
+        ranked = sorted(scores, key=lambda doc_id: (-scores[doc_id], doc_id))
+        # ValueError on a cursor that isn't an offset, like the Search API
+        offset = int(cursor or 0)
+        page = ranked[offset:offset + limit]
+        next_cursor = str(offset + limit) if offset + limit < len(ranked) else None
+        return page, next_cursor
+
+
+class SearchApiBackend(object):
+    """SearchApiBackend -- App Engine Search API, one index per kind"""
+
+    def index(self, kind, documents):
+        docs = []
+        for doc_id, fields, parent in documents:
+            doc_fields = [search_api.TextField(name=field, value=text)
+                          for field, text in fields.iteritems()]
+            if parent is not None:
+                doc_fields.append(search_api.AtomField(name='parent', value=parent))
+            docs.append(search_api.Document(doc_id=doc_id, fields=doc_fields))
+        index = search_api.Index(name=kind)
+        for i in range(0, len(docs), PUT_BATCH_SIZE):
+            index.put(docs[i:i + PUT_BATCH_SIZE])
+
+    def search(self, kind, words, weights, limit, cursor=None, parent=None):
+        # words are plain \w+ tokens, so they can't form query operators
+        query_string = ' '.join(words)
+        if parent is not None:
+            query_string += ' parent:"%s"' % parent
+        # ranked by the Search API's own term frequency scorer; the field
+        # weights only apply to InvertedIndexBackend
+        options = search_api.QueryOptions(
+            limit=limit,
+            ids_only=True,
+            cursor=search_api.Cursor(web_safe_string=cursor) if cursor
+                else search_api.Cursor(),
+            sort_options=search_api.SortOptions(
+                match_scorer=search_api.MatchScorer(),
+                expressions=[search_api.SortExpression(
+                    expression='_score',
+                    direction=search_api.SortExpression.DESCENDING,
+                    default_value=0)]))
+        results = search_api.Index(name=kind).search(
+            search_api.Query(query_string=query_string, options=options))
+        next_cursor = results.cursor.web_safe_string if results.cursor else None
+        return [doc.doc_id for doc in results.results], next_cursor
+
+
+_backend = [None]
+
+
+def backend():
+    """Return the search backend in use."""
+    if _backend[0] is None:
+        _backend[0] = SearchApiBackend()
+    return _backend[0]
+
+
+def setBackend(new_backend):
+    """Use new_backend, e.g. InvertedIndexBackend() in tests and benchmarks."""
+    _backend[0] = new_backend
+
+
+def _index(kind, documents):
+    # the entities are already saved: a failed index update only hides
+    # them from search until the next reindex
+    try:
+        backend().index(kind, documents)
+    except search_api.Error:
+        logging.exception('Could not index %d %s documents', len(documents), kind)
+
+
+def indexConferences(confs):
+    """Add or update Conferences in the search index."""
+    _index('Conference', [conferenceDocument(conf) for conf in confs])
+
+
+def indexSessions(sessions):
+    """Add or update Sessions in the search index."""
+    _index('Session', [sessionDocument(session) for session in sessions])
+
+
+def _search(kind, weights, query, limit, cursor, parent=None):
+    words = tokenize(query or '')
+    if not words:
+        return [], None
+    doc_ids, next_cursor = backend().search(kind, words, weights, limit, cursor, parent)
+    # skip documents of entities deleted since they were indexed
+    entities = ndb.get_multi([ndb.Key(urlsafe=doc_id) for doc_id in doc_ids])
+    return [entity for entity in entities if entity], next_cursor
+
+
+def searchConferences(query, limit, cursor=None):
+    """Return (ranked Conferences, next cursor) matching all words of query."""
+    return _search('Conference', CONFERENCE_FIELDS, query, limit, cursor)
+
+
+def searchSessions(query, limit, cursor=None, conf_key=None):
+    """Return (ranked Sessions, next cursor) matching all words of query,
+    optionally only of one Conference.
+    """
+    return _search('Session', SESSION_FIELDS, query, limit, cursor,
+                   conf_key.urlsafe() if conf_key else None)
+
+
+REINDEX_KINDS = [
+    ('Conference', Conference, indexConferences),
+    ('Session', Session, indexSessions),
+]
+
+
+def reindexBatch(kind, websafeCursor=None):
+    """Index one batch of REINDEX_BATCH_SIZE entities of kind; return
+    (kind, websafe cursor) of the next batch, or (None, None) when every
+    kind is done.  Used by ReindexSearchHandler() in main.py.
+    """
+    kinds = [name for name, model, indexer in REINDEX_KINDS]
+    name, model, indexer = REINDEX_KINDS[kinds.index(kind)]
+    cursor = ndb.Cursor(urlsafe=websafeCursor) if websafeCursor else None
+    entities, cursor, more = model.query().fetch_page(
+        REINDEX_BATCH_SIZE, start_cursor=cursor)
+    if entities:
+        indexer(entities)
+    if more and cursor:
+        return kind, cursor.urlsafe()
+    # on to the next kind, from its start
+    if kinds.index(kind) + 1 < len(kinds):
+        return kinds[kinds.index(kind) + 1], None
+    return None, None
+
+
+def reindexAll():
+    """Index every Conference and Session in this request, e.g. in tests
+    and benchmarks; deployed apps chain reindexBatch() through tasks.
+    """
+    kind, cursor = REINDEX_KINDS[0][0], None
+    while kind:
+        kind, cursor = reindexBatch(kind, cursor)
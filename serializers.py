@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+
+"""serializers.py
+
+Udacity conference server-side Python App Engine model-to-message serializers
+
+The field mapping between an ndb model and a ProtoRPC message is worked out
+once per (model, message) pair; copying a row then only runs the
+precomputed converters instead of walking all_fields() with hasattr checks.
+A field mask narrows the plan to the requested fields, so entities loaded
+by a projection query only have the masked properties read.
+
+"""
+
+from protorpc import messages
+from google.appengine.ext import ndb
+
+_SERIALIZERS = {}
+
+
+def _copy(value):
+    return value
+
+
+def _toString(value):
+    return str(value)
+
+
+def _keyToUrlsafe(value):
+    return value.urlsafe() if value is not None else None
+
+
+def _enumConverter(enum_type):
+    """Return converter from a stored enum name to the message Enum value."""
+    def convert(value):
+        return getattr(enum_type, value)
+    return convert
+
+
+class Serializer(object):
+    """Serializer -- precompiled field-mapping plan from ndb model to message"""
+
+    def __init__(self, model_cls, message_cls, computed=None):
+        computed = computed or {}
+        self.message_cls = message_cls
+        self.properties = []
+        self.computed = []
+
+        for field in message_cls.all_fields():
+            if field.name in computed:
+                # value derived from the entity itself, e.g. its key;
+                # None means the caller always passes it as an override
+                if computed[field.name] is not None:
+                    self.computed.append((field.name, computed[field.name]))
+                continue
+            prop = getattr(model_cls, field.name, None)
+            if isinstance(prop, ndb.Property):
+                self.properties.append(
+                    (field.name, self._converter(prop, field)))
+            # anything else (e.g. organizerDisplayName) is left to the caller
+
+        self.check = any(field.required for field in message_cls.all_fields())
+        self._masks = {}
+
+    @staticmethod
+    def _converter(prop, field):
+        """Pick the conversion for one model property / message field pair."""
+        if isinstance(field, messages.EnumField):
+            return _enumConverter(field.type)
+        # convert Date/Time to string; just copy others
+        if isinstance(prop, (ndb.DateProperty, ndb.TimeProperty,
+                             ndb.DateTimeProperty)):
+            return _toString
+        if isinstance(prop, ndb.KeyProperty):
+            return _keyToUrlsafe
+        return _copy
+
+    def _plan(self, fields):
+        """Return (properties, computed) converters limited to fields."""
+        if fields is None:
+            return self.properties, self.computed
+        fields = frozenset(fields)
+        plan = self._masks.get(fields)
+        if plan is None:
+            plan = self._masks[fields] = (
+                [(name, convert) for name, convert in self.properties if name in fields],
+                [(name, compute) for name, compute in self.computed if name in fields])
+        return plan
+
+    def serialize(self, entity, fields=None, **overrides):
+        """Copy entity into a new message, then apply overrides; with a
+        fields mask only the named fields are set.
+        """
+        msg = self.message_cls()
+        properties, computed = self._plan(fields)
+        for name, convert in properties:
+            setattr(msg, name, convert(getattr(entity, name)))
+        for name, compute in computed:
+            setattr(msg, name, compute(entity))
+        for name, value in overrides.iteritems():
+            if fields is None or name in fields:
+                setattr(msg, name, value)
+        if self.check:
+            msg.check_initialized()
+        return msg
+
+
+def getSerializer(model_cls, message_cls, **computed):
+    """Return the Serializer for a (model, message) pair, building it once."""
+    serializer = _SERIALIZERS.get((model_cls, message_cls))
+    if serializer is None:
+        serializer = Serializer(model_cls, message_cls, computed)
+        _SERIALIZERS[(model_cls, message_cls)] = serializer
+    return serializer
@@ -14,3 +14,12 @@ created/forked from conference.py by wesc on 2014 may 24
 # Console or Cloud Console.
 WEB_CLIENT_ID = '464866298133-52gh09hmk6hkj387php99etnsbh20ha2.apps.googleusercontent.com'
 
+# OAuth token verification for getUserId(user, id_type="oauth"); point these
+# at a local stand-in server to test without Google
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo'
+# verify id_tokens against Google's public keys instead of calling tokeninfo
+VERIFY_ID_TOKENS_LOCALLY = False
+CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+ID_TOKEN_ISSUERS = ['accounts.google.com', 'https://accounts.google.com']
+ID_TOKEN_AUDIENCES = [WEB_CLIENT_ID]
+
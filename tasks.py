@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+
+"""tasks.py
+
+Udacity conference server-side Python App Engine coalesced push tasks
+
+Work items of one kind are deduplicated per time bucket and packed into
+batch tasks.  A burst of session creations for the same (conference,
+speaker) therefore produces one featured speaker task, and a bulk import
+produces a handful of tasks instead of one per item.
+
+Deduplication marks each item's key in memcache with add_multi, so only the
+first request of a bucket schedules it.  If memcache loses a mark, or can't
+store one at all, the item is simply scheduled twice; the task handlers are
+idempotent.
+
+"""
+
+import hashlib
+import json
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+MAX_TASKS_PER_ADD = 100
+MAX_ITEMS_PER_TASK = 50
+
+# kind: (url, bucket seconds).  Tasks of a bucket run when it closes, so
+# later items of the same bucket are covered by the already-scheduled task.
+TASK_KINDS = {
+    'featured_speaker': ('/tasks/update_featured_speaker', 10),
+}
+
+
+def enqueue(kind, items):
+    """Schedule (dedupe key, work item dict) pairs of one task kind;
+    return the number of items that weren't already scheduled.
+    """
+    url, window = TASK_KINDS[kind]
+    now = time.time()
+    bucket = int(now) // window
+    # drop duplicates within the call, keeping the first item of each key
+    unique = {}
+    for key, item in items:
+        unique.setdefault('%s %s %d' % (kind, key, bucket), item)
+    if not unique:
+        return 0
+
+    # only items whose mark this request added are ours to schedule.
+    # add_multi also reports the marks it failed to store; those that
+    # aren't in memcache are scheduled anyway rather than dropped.
+    not_added = memcache.add_multi(
+        dict.fromkeys(unique, 1), time=window * 2)
+    if not_added:
+        for mark in memcache.get_multi(not_added):
+            unique.pop(mark)
+    marks = sorted(unique)
+
+    tasks = []
+    for i in range(0, len(marks), MAX_ITEMS_PER_TASK):
+        batch = marks[i:i + MAX_ITEMS_PER_TASK]
+        # the name is derived from the batch, so a retried add is a no-op
+        name = '%s-%d-%s' % (kind.replace('_', '-'), bucket,
+                             hashlib.md5('\n'.join(batch)).hexdigest())
+        tasks.append(taskqueue.Task(
+            name=name,
+            url=url,
+            params={'items': json.dumps([unique[mark] for mark in batch])},
+            countdown=window - now % window))
+    try:
+        addTasks(tasks)
+    except Exception:
+        # not scheduled after all: let the next request schedule the items
+        memcache.delete_multi(marks)
+        raise
+    return len(marks)
+
+
+def addBatchTask(url, run, cursor=None, **params):
+    """Schedule the batch of a chained job run that starts at cursor, with
+    any other params.  The task is named after the run, cursor and params,
+    so a retried batch doesn't fork the chain.
+    """
+    params.update(run=run, cursor=cursor or '')
+    batch = hashlib.md5(json.dumps(params, sort_keys=True)).hexdigest()
+    name = '%s-%s' % (url.strip('/').replace('/', '-').replace('_', '-'), batch)
+    addTasks([taskqueue.Task(name=name, url=url, params=params)])
+
+
+def addTasks(tasks, queue_name='default'):
+    """Enqueue tasks in batched adds, ignoring ones that already exist."""
+    queue = taskqueue.Queue(queue_name)
+    for i in range(0, len(tasks), MAX_TASKS_PER_ADD):
+        try:
+            queue.add(tasks[i:i + MAX_TASKS_PER_ADD])
+        except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+            # the rest of the batch is still added
+            pass
+
+
+def workItems(request):
+    """Return the work items of a task request: the batched 'items' param,
+    or the request's own params for tasks enqueued one by one.
+    """
+    items = request.get('items')
+    if items:
+        return json.loads(items)
+    return [dict((arg, request.get(arg)) for arg in request.arguments())]
@@ -0,0 +1,66 @@
+"""tests -- ConferenceApi tests on the App Engine testbed stubs
+
+Run from the repository root with the App Engine SDK available, e.g.
+
+    APPENGINE_SDK=/path/to/google_appengine python -m unittest discover -s tests -t .
+
+"""
+
+import os
+import unittest
+
+from benchmarks import setupSdk
+setupSdk()
+
+from google.appengine.datastore import datastore_stub_util
+from google.appengine.ext import ndb
+from google.appengine.ext import testbed
+
+import conference
+import metrics
+import search
+from caching import LayeredCache
+from conference import ConferenceApi
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ApiTestCase(unittest.TestCase):
+    """ApiTestCase -- ConferenceApi on fresh datastore, memcache and
+    taskqueue stubs
+    """
+
+    # fail queries that no index.yaml index serves, as the datastore would
+    requireIndexes = False
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.setup_env(app_id='dev~conference-test', overwrite=True)
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(probability=1),
+            require_indexes=self.requireIndexes,
+            root_path=ROOT if self.requireIndexes else None)
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        self.testbed.init_user_stub()
+        # the testbed replaced the API proxy the hooks were registered on
+        metrics.installHooks()
+        search.setBackend(search.InvertedIndexBackend())
+        # the in-instance cache layers outlive the stubs
+        for value in vars(conference).itervalues():
+            if isinstance(value, LayeredCache):
+                value.local.clear()
+        ndb.get_context().clear_cache()
+        self.api = ConferenceApi()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def signIn(self, email):
+        """Start a new request signed in as email."""
+        ndb.get_context().clear_cache()
+        os.environ['ENDPOINTS_AUTH_EMAIL'] = email
+        os.environ['ENDPOINTS_AUTH_DOMAIN'] = 'example.com'
@@ -0,0 +1,95 @@
+"""test_conferences.py -- queryConferences filters and paging, bulk creation"""
+
+from google.appengine.ext import ndb
+from protorpc import message_types
+
+from models import ConferenceForm
+from models import ConferenceForms
+from models import ConferenceQueryForm
+from models import ConferenceQueryForms
+from models import NearlySoldOut
+from tests import ApiTestCase
+
+ORGANIZER = 'organizer@example.com'
+
+
+class QueryConferencesTest(ApiTestCase):
+
+    def setUp(self):
+        super(QueryConferencesTest, self).setUp()
+        self.signIn(ORGANIZER)
+        # (name, city, month)
+        self.conferences = [
+            ('Alpha', 'London', 3), ('Bravo', 'London', 5), ('Charlie', 'Paris', 5),
+            ('Delta', 'London', 7), ('Echo', 'Paris', 3), ('Foxtrot', 'London', 9),
+            ('Golf', 'London', 5),
+        ]
+        for name, city, month in self.conferences:
+            self.api.createConference(ConferenceForm(
+                name=name, city=city, topics=['Web Technologies'],
+                startDate='2016-%02d-01' % month, maxAttendees=10))
+
+    def queryAll(self, filters, pageSize):
+        """Return the names of all pages of a query, following nextCursor."""
+        names = []
+        cursor = None
+        while True:
+            forms = self.api.queryConferences(ConferenceQueryForms(
+                filters=[ConferenceQueryForm(field=field, operator=op, value=value)
+                         for field, op, value in filters],
+                pageSize=pageSize, cursor=cursor))
+            self.assertLessEqual(len(forms.items), pageSize)
+            names.extend(form.name for form in forms.items)
+            cursor = forms.nextCursor
+            if not cursor:
+                return names
+
+    def testNotEqualPaged(self):
+        names = self.queryAll([('MONTH', 'NE', '3')], pageSize=2)
+        # ordered by the inequality property, then name
+        expected = [name for name, city, month in
+                    sorted(self.conferences, key=lambda c: (c[2], c[0])) if month != 3]
+        self.assertEqual(expected, names)
+
+    def testNotEqualUnpaged(self):
+        forms = self.api.queryConferences(ConferenceQueryForms(
+            filters=[ConferenceQueryForm(field='MONTH', operator='NE', value='5')]))
+        self.assertEqual(['Alpha', 'Echo', 'Delta', 'Foxtrot'],
+                         [form.name for form in forms.items])
+        self.assertIsNone(forms.nextCursor)
+
+    def testEqualityWithNotEqualPostFiltered(self):
+        # no index serves city = with month !=, so the city filter is
+        # applied while streaming the month != query
+        names = self.queryAll([('CITY', 'EQ', 'London'), ('MONTH', 'NE', '5')], pageSize=2)
+        self.assertEqual(['Alpha', 'Delta', 'Foxtrot'], names)
+
+        forms = self.api.queryConferences(ConferenceQueryForms(filters=[
+            ConferenceQueryForm(field='CITY', operator='EQ', value='London'),
+            ConferenceQueryForm(field='MONTH', operator='NE', value='5')]))
+        self.assertEqual(['Alpha', 'Delta', 'Foxtrot'], [form.name for form in forms.items])
+        self.assertIsNone(forms.nextCursor)
+
+
+class BulkCreateConferencesTest(ApiTestCase):
+
+    def testNearlySoldOutInOneTransaction(self):
+        self.signIn(ORGANIZER)
+        puts = []
+        NearlySoldOut._pre_put_hook = lambda nearly: puts.append(nearly.key)
+        try:
+            forms = self.api.bulkCreateConferences(ConferenceForms(
+                items=[ConferenceForm(name='Small %d' % i, maxAttendees=3) for i in range(3)] +
+                      [ConferenceForm(name='Large', maxAttendees=100)]))
+        finally:
+            del NearlySoldOut._pre_put_hook
+
+        self.assertEqual(1, len(puts))
+        self.assertEqual(['Small 0', 'Small 1', 'Small 2'], puts[0].get().conferenceNames)
+        announcement = self.api.getAnnouncement(message_types.VoidMessage())
+        self.assertIn('Small 0, Small 1, Small 2', announcement.data)
+
+        # the returned forms carry the keys of the new conferences
+        confs = ndb.get_multi([ndb.Key(urlsafe=form.websafeKey) for form in forms.items])
+        self.assertEqual(['Small 0', 'Small 1', 'Small 2', 'Large'],
+                         [conf.name for conf in confs])
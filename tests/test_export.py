@@ -0,0 +1,82 @@
+"""test_export.py -- attendee export of a synthetic conference
+
+A few pages of rows are enough to show that pages are read one at a time.
+Set EXPORT_TEST_ROWS=50000 to export a conference of that size instead
+(slow: the datastore stub holds every entity in memory).
+
+"""
+
+import csv
+import json
+import os
+from datetime import date
+
+from google.appengine.ext import ndb
+
+import export
+from models import Conference
+from models import Profile
+from models import Registration
+from tests import ApiTestCase
+
+# four full pages and a partial one
+ROWS = int(os.environ.get('EXPORT_TEST_ROWS', 4 * export.EXPORT_BATCH_SIZE + 17))
+PUT_BATCH_SIZE = 500
+
+
+class AttendeeExportTest(ApiTestCase):
+
+    def setUp(self):
+        super(AttendeeExportTest, self).setUp()
+        org_key = ndb.Key(Profile, 'organizer@example.com')
+        self.conf_key = ndb.Key(Conference, 1, parent=org_key)
+        Conference(key=self.conf_key, name='Export conference',
+                   organizerUserId='organizer@example.com', maxAttendees=ROWS,
+                   seatsAvailable=0, startDate=date(2016, 6, 1), month=6).put()
+        for first in range(0, ROWS, PUT_BATCH_SIZE):
+            entities = []
+            for i in range(first, min(first + PUT_BATCH_SIZE, ROWS)):
+                p_key = ndb.Key(Profile, 'attendee%d@example.com' % i)
+                entities.append(Profile(key=p_key, displayName='Attendee %d' % i,
+                                        mainEmail='attendee%d@example.com' % i))
+                entities.append(Registration(
+                    key=ndb.Key(Registration, self.conf_key.urlsafe(), parent=p_key),
+                    conference=self.conf_key))
+            ndb.put_multi(entities, use_cache=False)
+        ndb.get_context().clear_cache()
+
+    def assertBounded(self, rows_in_chunk):
+        # pages are read one at a time, and nothing stays behind in
+        # the in-context cache
+        self.assertLessEqual(rows_in_chunk, export.EXPORT_BATCH_SIZE)
+        self.assertLess(len(ndb.get_context()._cache), export.EXPORT_BATCH_SIZE)
+
+    def testCsv(self):
+        content_type, chunks = export.exportChunks('attendees', self.conf_key, 'csv')
+        self.assertEqual('text/csv', content_type)
+        emails = set()
+        header = None
+        size = 0
+        for chunk in chunks:
+            size += len(chunk)
+            rows = list(csv.reader(chunk.splitlines()))
+            if header is None:
+                header = rows.pop(0)
+            self.assertBounded(len(rows))
+            emails.update(row[1] for row in rows)
+        self.assertEqual(export.ATTENDEE_COLUMNS, header)
+        self.assertEqual(set('attendee%d@example.com' % i for i in range(ROWS)), emails)
+        self.assertLess(size, export.MAX_RESPONSE_BYTES)
+
+    def testNdjson(self):
+        content_type, chunks = export.exportChunks('attendees', self.conf_key, 'ndjson')
+        self.assertEqual('application/x-ndjson', content_type)
+        count = 0
+        for chunk in chunks:
+            lines = chunk.splitlines()
+            self.assertBounded(len(lines))
+            for line in lines:
+                row = json.loads(line)
+                self.assertEqual(set(export.ATTENDEE_COLUMNS), set(row))
+                count += 1
+        self.assertEqual(ROWS, count)
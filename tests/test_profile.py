@@ -0,0 +1,67 @@
+"""test_profile.py -- profiles read through PROFILE_CACHE"""
+
+from google.appengine.ext import ndb
+from protorpc import message_types
+
+import conference
+from models import Profile
+from models import ProfileMiniForm
+from models import TeeShirtSize
+from tests import ApiTestCase
+
+EMAIL = 'attendee@example.com'
+
+
+class ProfileCacheTest(ApiTestCase):
+
+    def testGetProfileMissThenHit(self):
+        self.signIn(EMAIL)
+        # miss: created, stored and cached
+        created = self.api.getProfile(message_types.VoidMessage())
+        self.assertEqual(EMAIL, created.mainEmail)
+        self.assertIsNotNone(conference.PROFILE_CACHE.get(EMAIL))
+
+        # hit: decoded from the cached protobuf
+        self.signIn(EMAIL)
+        cached = self.api.getProfile(message_types.VoidMessage())
+        self.assertEqual(created, cached)
+        self.assertEqual(ndb.Key(Profile, EMAIL).get(),
+                         self.api._getProfileFromUser())
+
+        # hit in memcache only, as on another instance
+        conference.PROFILE_CACHE.local.clear()
+        conference.PROFILE_FORM_CACHE.local.clear()
+        self.signIn(EMAIL)
+        self.assertEqual(created, self.api.getProfile(message_types.VoidMessage()))
+
+    def testSaveProfileUpdatesCache(self):
+        self.signIn(EMAIL)
+        self.api.getProfile(message_types.VoidMessage())
+        self.signIn(EMAIL)
+        self.api.saveProfile(ProfileMiniForm(displayName='Renamed',
+                                             teeShirtSize=TeeShirtSize.M_M))
+
+        self.signIn(EMAIL)
+        form = self.api.getProfile(message_types.VoidMessage())
+        self.assertEqual('Renamed', form.displayName)
+        self.assertEqual(TeeShirtSize.M_M, form.teeShirtSize)
+        self.assertEqual('Renamed', self.api._getProfileFromUser().displayName)
+
+    def testSaveProfileIgnoresStaleCache(self):
+        self.signIn(EMAIL)
+        self.api.getProfile(message_types.VoidMessage())
+        stale = conference.PROFILE_CACHE.get(EMAIL)
+
+        # another request changes the stored profile, and this instance
+        # still holds the old cached copy
+        self.signIn(EMAIL)
+        self.api.saveProfile(ProfileMiniForm(teeShirtSize=TeeShirtSize.L_M))
+        conference.PROFILE_CACHE.set(EMAIL, stale)
+
+        self.signIn(EMAIL)
+        form = self.api.saveProfile(ProfileMiniForm(displayName='Renamed'))
+        self.assertEqual('Renamed', form.displayName)
+        self.assertEqual(TeeShirtSize.L_M, form.teeShirtSize)
+        stored = ndb.Key(Profile, EMAIL).get(use_cache=False, use_memcache=False)
+        self.assertEqual(str(TeeShirtSize.L_M), stored.teeShirtSize)
+        self.assertEqual('Renamed', stored.displayName)
@@ -0,0 +1,56 @@
+"""test_registrations.py -- registrations and the legacy profile lists"""
+
+from google.appengine.ext import ndb
+
+import conference
+from conference import CONF_PAGE_REQUEST
+from conference import ConferenceApi
+from models import Conference
+from models import ConferenceForm
+from models import Profile
+from tests import ApiTestCase
+
+ORGANIZER = 'organizer@example.com'
+
+
+class MigrateProfilesTest(ApiTestCase):
+
+    def setUp(self):
+        super(MigrateProfilesTest, self).setUp()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Legacy conference', city='London', startDate='2016-07-01',
+            maxAttendees=100))
+        self.wsck = Conference.query().get().key.urlsafe()
+        # registered before registrations were child entities
+        ndb.put_multi([Profile(key=ndb.Key(Profile, 'legacy%d@example.com' % i),
+                               displayName='Legacy %d' % i,
+                               mainEmail='legacy%d@example.com' % i,
+                               conferenceKeysToAttend=[self.wsck])
+                       for i in range(5)])
+
+    def attendees(self):
+        self.signIn(ORGANIZER)
+        forms = self.api.getConferenceAttendees(
+            CONF_PAGE_REQUEST.combined_message_class(websafeConferenceKey=self.wsck))
+        return sorted(form.mainEmail for form in forms.items)
+
+    def testMigrationInBatches(self):
+        self.assertEqual([], self.attendees())
+
+        # two profiles per batch, following the cursor like the task chain
+        batch_size = conference.MIGRATION_BATCH_SIZE
+        conference.MIGRATION_BATCH_SIZE = 2
+        try:
+            cursor = ConferenceApi._migrateProfiles()
+            batches = 1
+            while cursor:
+                cursor = ConferenceApi._migrateProfiles(cursor)
+                batches += 1
+        finally:
+            conference.MIGRATION_BATCH_SIZE = batch_size
+
+        self.assertEqual(3, batches)
+        self.assertEqual(['legacy%d@example.com' % i for i in range(5)], self.attendees())
+        for prof in Profile.query():
+            self.assertEqual([], prof.conferenceKeysToAttend)
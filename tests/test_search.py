@@ -0,0 +1,51 @@
+"""test_search.py -- reindexing the search index in chained batches"""
+
+import search
+from conference import CONF_SEARCH_REQUEST
+from conference import SESSION_SEARCH_REQUEST
+from models import BulkSessionForms
+from models import Conference
+from models import ConferenceForm
+from models import SessionForm
+from tests import ApiTestCase
+
+ORGANIZER = 'organizer@example.com'
+
+
+class ReindexTest(ApiTestCase):
+
+    def setUp(self):
+        super(ReindexTest, self).setUp()
+        self.signIn(ORGANIZER)
+        for i in range(5):
+            self.api.createConference(ConferenceForm(
+                name='Reindexed conference %d' % i, city='London',
+                startDate='2016-07-01', maxAttendees=10))
+        self.wsck = Conference.query().get().key.urlsafe()
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=self.wsck,
+            items=[SessionForm(name='Reindexed session %d' % i) for i in range(3)]))
+
+    def testReindexChain(self):
+        # an index that lost everything
+        search.setBackend(search.InvertedIndexBackend())
+
+        # two entities per batch, following (kind, cursor) like the task chain
+        batch_size = search.REINDEX_BATCH_SIZE
+        search.REINDEX_BATCH_SIZE = 2
+        try:
+            batches = []
+            kind, cursor = 'Conference', None
+            while kind:
+                batches.append(kind)
+                kind, cursor = search.reindexBatch(kind, cursor)
+        finally:
+            search.REINDEX_BATCH_SIZE = batch_size
+        self.assertEqual(['Conference'] * 3 + ['Session'] * 2, batches)
+
+        conferences = self.api.searchConferences(
+            CONF_SEARCH_REQUEST.combined_message_class(query='reindexed'))
+        self.assertEqual(5, len(conferences.items))
+        sessions = self.api.searchSessions(SESSION_SEARCH_REQUEST.combined_message_class(
+            query='reindexed', websafeConferenceKey=self.wsck))
+        self.assertEqual(3, len(sessions.items))
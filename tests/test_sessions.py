@@ -0,0 +1,162 @@
+"""test_sessions.py -- session and speaker queries of a conference"""
+
+from google.appengine.ext import ndb
+from protorpc import message_types
+
+from conference import CONF_GET_REQUEST
+from conference import ConferenceApi
+from models import BulkSessionForms
+from models import Conference
+from models import ConferenceForm
+from models import Session
+from models import SessionByDateForm
+from models import SessionFilterForm
+from models import SessionForm
+from models import SessionSearchForm
+from models import Speaker
+from tests import ApiTestCase
+
+ORGANIZER = 'organizer@example.com'
+
+
+class ConferenceSessionsTest(ApiTestCase):
+
+    def setUp(self):
+        super(ConferenceSessionsTest, self).setUp()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Sessions conference', city='London', startDate='2016-07-01',
+            maxAttendees=100))
+        self.wsck = Conference.query().get().key.urlsafe()
+        # 20 sessions, 4 each by 5 speakers
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=self.wsck,
+            items=[SessionForm(name='Session %d' % i, speaker='Speaker %d' % (i % 5),
+                               typeOfSession='lecture', date='2016-07-01',
+                               startTime='%02d:00' % (8 + i % 10), duration=60)
+                   for i in range(20)]))
+
+    def testSpeakersInConference(self):
+        self.signIn('attendee@example.com')
+        speakers = self.api.getSpeakersInConference(
+            CONF_GET_REQUEST.combined_message_class(websafeConferenceKey=self.wsck))
+        # one row per speaker, however many sessions each has
+        self.assertEqual(['Speaker %d' % i for i in range(5)],
+                         [speaker.name for speaker in speakers.items])
+        self.assertEqual(5, len(set(speaker.websafeSpeakerKey for speaker in speakers.items)))
+
+    def testMultipleInequalitiesUntruncated(self):
+        # more matches than one page of MAX_PAGE_SIZE
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=self.wsck,
+            items=[SessionForm(name='Extra %d' % i, typeOfSession=type_,
+                               date='2016-07-02', startTime=time_)
+                   for i in range(45)
+                   for type_, time_ in (('lecture', '10:00'), ('workshop', '10:00'),
+                                        ('lecture', '20:00'), ('panel', '18:30'))]))
+        self.signIn('attendee@example.com')
+        sessions = self.api.getSessionsByMultipleInequalities(message_types.VoidMessage())
+        # 20 from setUp, plus the lectures at 10:00 and panels at 18:30
+        self.assertEqual(110, len(sessions.items))
+        self.assertIsNone(sessions.nextCursor)
+
+    def testSessionsByDate(self):
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=self.wsck,
+            items=[SessionForm(name='Day two', date='2016-07-02'),
+                   SessionForm(name='Day three', date='2016-07-03')]))
+        self.signIn('attendee@example.com')
+        sessions = self.api.getSessionsByDate(SessionByDateForm(
+            websafeConferenceKey=self.wsck, startDate='2016-07-02', endDate='2016-07-02'))
+        self.assertEqual(['Day two'], [session.name for session in sessions.items])
+        # an open-ended range
+        sessions = self.api.getSessionsByDate(SessionByDateForm(
+            websafeConferenceKey=self.wsck, startDate='2016-07-02'))
+        self.assertEqual(['Day two', 'Day three'], [session.name for session in sessions.items])
+
+
+class LegacySpeakerTest(ApiTestCase):
+
+    def testLegacySpeakerReused(self):
+        # created before speakers were keyed by name
+        legacy_key = Speaker(name='Old  Speaker').put()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Legacy speaker conference', city='London', startDate='2016-07-01',
+            maxAttendees=100))
+        wsck = Conference.query().get().key.urlsafe()
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=wsck,
+            items=[SessionForm(name='Old talk', speaker='old speaker'),
+                   SessionForm(name='New talk', speaker='New Speaker')]))
+
+        sessions = dict((session.name, session) for session in Session.query())
+        self.assertEqual(legacy_key, sessions['Old talk'].speaker)
+        self.assertEqual(ndb.Key(Speaker, 'new speaker'), sessions['New talk'].speaker)
+        self.assertEqual(2, Speaker.query().count())
+
+
+class FeaturedSpeakerTest(ApiTestCase):
+
+    def testLatestSpeakerOfBatchFeatured(self):
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Featured conference', city='London', startDate='2016-07-01',
+            maxAttendees=100))
+        wsck = Conference.query().get().key.urlsafe()
+        for speaker in ('Zed', 'Amy'):
+            self.api.bulkCreateSessions(BulkSessionForms(
+                websafeConferenceKey=wsck,
+                items=[SessionForm(name='%s talk %d' % (speaker, i), speaker=speaker)
+                       for i in range(2)]))
+
+        # Amy's sessions were added last, whatever the order of the batch
+        pairs = [(wsck, ndb.Key(Speaker, name).urlsafe()) for name in ('amy', 'zed')]
+        for batch in (pairs, pairs[::-1]):
+            ConferenceApi._cacheFeaturedSpeakers(batch)
+            featured = self.api.getFeaturedSpeaker(message_types.VoidMessage()).data
+            self.assertIn('Amy is speaking', featured)
+
+
+class QuerySessionsIndexTest(ApiTestCase):
+
+    requireIndexes = True
+
+    def setUp(self):
+        super(QuerySessionsIndexTest, self).setUp()
+        self.signIn(ORGANIZER)
+        self.api.createConference(ConferenceForm(
+            name='Indexed conference', city='London', startDate='2016-07-01',
+            maxAttendees=100))
+        self.wsck = Conference.query().get().key.urlsafe()
+        self.api.bulkCreateSessions(BulkSessionForms(
+            websafeConferenceKey=self.wsck,
+            items=[SessionForm(name='%s %d' % (type_, i), typeOfSession=type_,
+                               date='2016-07-0%d' % (i + 1), startTime='1%d:00' % i,
+                               duration=30 * (i + 1))
+                   for i in range(3) for type_ in ('keynote', 'lecture', 'workshop')]))
+
+    def querySessions(self, *filters):
+        self.signIn('attendee@example.com')
+        sessions = self.api.querySessions(SessionSearchForm(
+            websafeConferenceKey=self.wsck,
+            filters=[SessionFilterForm(field=field, operator=op, value=value)
+                     for field, op, value in filters]))
+        return sorted(session.name for session in sessions.items)
+
+    def testPushedFilterOfEveryField(self):
+        # each field's filter is pushed into the datastore query on its own
+        self.assertEqual(['keynote 0', 'lecture 0', 'workshop 0'],
+                         self.querySessions(('DATE', 'LT', '2016-07-02')))
+        self.assertEqual(['keynote 2', 'lecture 2', 'workshop 2'],
+                         self.querySessions(('START_TIME', 'GTEQ', '12:00')))
+        self.assertEqual(['keynote 1', 'lecture 1', 'workshop 1'],
+                         self.querySessions(('DURATION', 'EQ', '60')))
+        self.assertEqual(['lecture 0', 'lecture 1', 'lecture 2',
+                          'workshop 0', 'workshop 1', 'workshop 2'],
+                         self.querySessions(('TYPE', 'GT', 'keynote')))
+        self.assertEqual(['lecture 1'],
+                         self.querySessions(('TYPE', 'GT', 'keynote'),
+                                            ('TYPE', 'LT', 'workshop'),
+                                            ('DURATION', 'NE', '30'),
+                                            ('DURATION', 'NE', '90')))
@@ -1,11 +1,29 @@
+import base64
+import hashlib
 import json
 import os
+import re
 import time
 import uuid
 
 from google.appengine.api import urlfetch
 from models import Profile
 
+import settings
+from caching import LayeredCache
+
+# sha256 of an OAuth token -> user id, for as long as the token is valid
+TOKEN_CACHE = LayeredCache('OAUTH TOKEN', max_size=5000,
+                           local_ttl=300, memcache_ttl=3600)
+
+# Google's public signing keys by key id, for local id_token verification
+CERTS_CACHE = LayeredCache('OAUTH CERTS', max_size=1,
+                           local_ttl=3600, memcache_ttl=6 * 3600)
+CERTS_CACHE_KEY = 'certs'
+DEFAULT_CERTS_TTL = 3600
+# clock skew allowed on id_token expiry
+CLOCK_SKEW = 60
+
 def getUserId(user, id_type="email"):
     if id_type == "email":
         return user.email()
@@ -17,22 +35,26 @@ def getUserId(user, id_type="email"):
         token_type = 'id_token'
         if 'OAUTH_USER_ID' in os.environ:
             token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+
+        # tokens seen before resolve without any fetch
+        token_hash = hashlib.sha256(token).hexdigest()
+        user_id = TOKEN_CACHE.get(token_hash)
+        if user_id:
+            return user_id
+
+        user_id, expires_in = '', 0
+        if token_type == 'id_token' and settings.VERIFY_ID_TOKENS_LOCALLY:
+            try:
+                user_id, expires_in = _verifyIdToken(token)
+            except ValueError:
+                # not verifiable here: let tokeninfo decide
+                pass
+        if not user_id:
+            user_id, expires_in = _fetchTokenInfo(token, token_type)
+
+        if user_id:
+            TOKEN_CACHE.set(token_hash, user_id, ttl=expires_in)
+        return user_id
 
     if id_type == "custom":
         # implement your own user_id creation and getting algorythm
@@ -43,3 +65,85 @@ def getUserId(user, id_type="email"):
             return profile.id()
         else:
             return str(uuid.uuid1().get_hex())
+
+
+def _fetchTokenInfo(token, token_type):
+    """Return (user id, seconds until the token expires) from tokeninfo."""
+    url = '%s?%s=%s' % (settings.TOKENINFO_URL, token_type, token)
+    user = {}
+    wait = 0.1
+    for i in range(3):
+        resp = urlfetch.fetch(url, deadline=5)
+        if resp.status_code == 200:
+            user = json.loads(resp.content)
+            break
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            url = '%s?%s=%s' % (settings.TOKENINFO_URL, 'access_token', token)
+        else:
+            time.sleep(wait)
+            wait *= 2
+    return user.get('user_id', ''), int(user.get('expires_in', 0))
+
+
+def _b64decode(segment):
+    """Decode unpadded base64url."""
+    return base64.urlsafe_b64decode(str(segment) + '=' * (-len(segment) % 4))
+
+
+def _getCerts(refresh=False):
+    """Return {key id: (modulus, exponent)} of Google's signing keys."""
+    certs = None if refresh else CERTS_CACHE.get(CERTS_CACHE_KEY)
+    if certs is None:
+        resp = urlfetch.fetch(settings.CERTS_URL, deadline=5)
+        if resp.status_code != 200:
+            raise ValueError('Could not fetch signing keys')
+        certs = {}
+        for key in json.loads(resp.content)['keys']:
+            certs[key['kid']] = (long(_b64decode(key['n']).encode('hex'), 16),
+                                 long(_b64decode(key['e']).encode('hex'), 16))
+        # the keys rotate; keep them as long as Google says they're good
+        max_age = re.search(r'max-age=(\d+)', resp.headers.get('Cache-Control', ''))
+        CERTS_CACHE.set(CERTS_CACHE_KEY, certs,
+                        ttl=int(max_age.group(1)) if max_age else DEFAULT_CERTS_TTL)
+    return certs
+
+
+def _verifyIdToken(token):
+    """Verify an RS256 id_token's signature and claims locally; return
+    (user id, seconds until it expires) or raise ValueError.
+    """
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Signature import PKCS1_v1_5
+
+    try:
+        header, payload, signature = token.split('.')
+        header_data = json.loads(_b64decode(header))
+        claims = json.loads(_b64decode(payload))
+        signature = _b64decode(signature)
+    except (TypeError, ValueError):
+        raise ValueError('Malformed id_token')
+    if header_data.get('alg') != 'RS256':
+        raise ValueError('Unsupported id_token algorithm')
+
+    kid = header_data.get('kid')
+    certs = _getCerts()
+    if kid not in certs:
+        # signed with a key newer than ours
+        certs = _getCerts(refresh=True)
+    if kid not in certs:
+        raise ValueError('Unknown id_token signing key')
+
+    verifier = PKCS1_v1_5.new(RSA.construct(certs[kid]))
+    if not verifier.verify(SHA256.new('%s.%s' % (header, payload)), signature):
+        raise ValueError('Invalid id_token signature')
+
+    expires_in = int(claims.get('exp', 0)) - int(time.time())
+    if expires_in < -CLOCK_SKEW:
+        raise ValueError('Expired id_token')
+    if claims.get('iss') not in settings.ID_TOKEN_ISSUERS:
+        raise ValueError('Unexpected id_token issuer')
+    if claims.get('aud') not in settings.ID_TOKEN_AUDIENCES and \
+            claims.get('azp') not in settings.ID_TOKEN_AUDIENCES:
+        raise ValueError('Unexpected id_token audience')
+    return claims.get('sub', ''), expires_in